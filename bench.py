@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")               # headless pygame
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+from settings import *
+from chart import load_chart, load_compiled, format_time
+from simulation import Simulation, run
+from replay import Replay, verify
+
+
+def generate_chart(path, notes, density=20, seed=0):           # synthetic chart, density: notes per second
+    rand = random.Random(seed)
+    lines = list()
+    note_num = 0
+    song_time = 1000
+
+    while note_num < notes:
+        chord = min(rand.randint(1, 3), notes - note_num)
+        enemies = [str(rand.randint(1, 3)) + rand.choice("UL") + str(rand.randint(2, 9)) for _ in range(chord)]
+        lines.append(format_time(song_time) + " - " + ", ".join(enemies))
+        note_num += chord
+        song_time += max(10, round(rand.expovariate(density / chord) * 1000 / 10) * 10)
+
+    lines.append(format_time(song_time + 5000) + " - END")
+
+    with open(path, 'w', encoding="UTF-8") as chart_file:
+        chart_file.write("score:0:" + str(notes * 100) + "\n\n" + "\n".join(lines))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * p // 100)] if values else 0
+
+
+def timed(func, *args):                                         # (result, ms)
+    start = time.perf_counter_ns()
+    result = func(*args)
+    return result, (time.perf_counter_ns() - start) / 1000000
+
+
+def bench_chart(game, path, notes, frames):
+    result = {"notes": notes}
+    chart, result["parse_text_ms"] = timed(load_chart, path)
+    _, result["compile_ms"] = timed(load_compiled, path)         # first load writes the .mrc
+    _, result["load_compiled_ms"] = timed(load_compiled, path)
+
+    game.song_list.append(os.path.basename(path))               # load_songData through the game
+    game.song_path.append(path)
+    game.song_dataPath.append(path)
+    game.song_highScore.append(notes * 1000)                   # never beaten: nothing goes to the score journal
+    game.song_perfectScore.append(notes * 100)
+    game.song_select = len(game.song_list)
+    _, result["load_songData_ms"] = timed(game.load_songData)
+
+    sim = Simulation(chart)                                     # spawn: Note objects for every row
+    start = time.perf_counter_ns()
+
+    while not sim.finished:
+        sim.spawn(sim.chart.end_time)
+
+    result["spawn_us_per_note"] = (time.perf_counter_ns() - start) / 1000 / max(notes, 1)
+
+    enemy_num = min(notes, 5000)                                # spawn: Enemy sprites, as create_enemy does
+    main_module = sys.modules["main"]
+    enemies = list()
+    start = time.perf_counter_ns()
+
+    for note in list(sim.notes)[:enemy_num]:
+        enemy = game.enemy_pool.pop() if game.enemy_pool else main_module.Enemy(game)
+        enemy.spawn(note)
+        enemies.append(enemy)
+
+    result["enemy_spawn_us"] = (time.perf_counter_ns() - start) / 1000 / max(enemy_num, 1)
+
+    for enemy in enemies:
+        enemy.release()
+
+    result["peak_notes"] = chart.peak_notes
+
+    presses = sorted((note.hit_time, note.lane) for note in sim.notes)     # judgment against full lane queues
+    start = time.perf_counter_ns()
+
+    for hit_time, lane in presses:
+        sim.press(lane, hit_time)
+
+    result["judgment_us_per_press"] = (time.perf_counter_ns() - start) / 1000 / max(len(presses), 1)
+    result["judgment_score"] = sim.score
+
+    replay = Replay(chart.digest)
+    headless, result["simulation_ms"] = timed(run, chart, (), True, 1000 / FPS, None, replay)
+    result["simulation_song_ms"] = headless.song_time
+    replay.score = headless.score
+    (result["replay_ok"], _), result["replay_verify_ms"] = timed(verify, chart, replay)
+    result["replay_bytes"] = len(replay.to_bytes())
+
+    game.new()                                                  # full frames on the play screen
+    game.load_songData()
+    game.screen_mode = 4
+    game.screen_value = [ALPHA_MAX, 0, 0, 0]
+    game.drawn_mode = -1
+    game.game_tick = 0
+    frame_ms = list()
+    peak_enemies = 0
+    pygame = main_module.pygame
+
+    for frame in range(frames):
+        game.start_tick = pygame.time.get_ticks() - round(frame * 1000 / FPS)
+        start = time.perf_counter_ns()
+        game.events()
+        game.update()
+        game.draw()
+
+        if game.dirty_rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(game.dirty_rects)
+
+        frame_ms.append((time.perf_counter_ns() - start) / 1000000)
+        peak_enemies = max(peak_enemies, len(game.enemys))
+
+    result["frame_ms_mean"] = sum(frame_ms) / max(len(frame_ms), 1)
+    result["frame_ms_p50"] = percentile(frame_ms, 50)
+    result["frame_ms_p95"] = percentile(frame_ms, 95)
+    result["frame_ms_p99"] = percentile(frame_ms, 99)
+    result["peak_enemies"] = peak_enemies
+    result["notes_allocated"] = game.sim.pool.allocated
+    game.new()
+    return result
+
+
+def compare(old_path, new_path):                                # new / old ratio for every shared metric
+    with open(old_path, 'r', encoding="UTF-8") as old_file, open(new_path, 'r', encoding="UTF-8") as new_file:
+        old, new = json.load(old_file), json.load(new_file)
+
+    old_results = {i["notes"]: i for i in old["results"]}
+
+    for result in new["results"]:
+        if result["notes"] not in old_results:
+            continue
+
+        print("notes %d" % result["notes"])
+
+        for key, value in result.items():
+            old_value = old_results[result["notes"]].get(key)
+
+            if key != "notes" and isinstance(value, (int, float)) and old_value:
+                print("    %-24s %12.4f -> %12.4f  (x%.2f)" % (key, old_value, value, value / old_value))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Muse Rush benchmark (synthetic charts, dummy video driver)")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="note counts, comma separated")
+    parser.add_argument("--density", type=float, default=20, help="notes per second")
+    parser.add_argument("--frames", type=int, default=300, help="play screen frames per chart")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="", help="write the json result here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    args = parser.parse_args(argv[1:])
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    import main as game_main
+    game = game_main.MuseRush()
+    game.finish_loading(wait=True)                              # assets and songs without the logo screen
+    results = list()
+
+    with tempfile.TemporaryDirectory() as chart_dir:
+        for notes in [int(i) for i in args.sizes.split(',')]:
+            path = os.path.join(chart_dir, "bench" + str(notes) + ".ini")
+            generate_chart(path, notes, args.density, args.seed)
+            results.append(bench_chart(game, path, notes, args.frames))
+            print("notes %d done" % notes, file=sys.stderr)
+
+    report = {"meta": {"python": platform.python_version(), "pygame": game_main.pygame.version.ver,
+                       "platform": platform.platform(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "density": args.density, "frames": args.frames, "seed": args.seed,
+                       "dirty_render": DIRTY_RENDER},
+              "results": results}
+    game_main.pygame.quit()
+
+    if args.output:
+        with open(args.output, 'w', encoding="UTF-8") as output_file:
+            json.dump(report, output_file, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,239 @@
+import os
+import sys
+import mmap
+import struct
+import hashlib
+from array import array
+from settings import WIDTH, FPS
+
+LINE_UPPER = 0                                                  # enemy line value (matches Enemy.line)
+LINE_LOWER = 270
+END = -1                                                        # end of song marker
+
+COMPILED_EXT = ".mrc"                                           # compiled chart next to the .ini
+COMPILED_MAGIC = b"MRC1"
+COMPILED_VERSION = 2
+COMPILED_HEADER = struct.Struct("<4sIqqiiqi")                   # magic, version, mtime_ns, size, rows, notes, end,
+                                                                # peak notes
+
+
+class Chart:                                                    # Array-Backed Chart
+    def __init__(self, times=None, starts=None, types=None, lanes=None, speeds=None, end_time=END, peak=-1):
+        self.times = times if times is not None else array('i')         # row spawn time (ms)
+        self.starts = starts if starts is not None else array('i', [0]) # row -> first note index
+        self.types = types if types is not None else array('b')         # note enemy type (1, 2, 3)
+        self.lanes = lanes if lanes is not None else array('b')         # note lane (0: upper, 1: lower)
+        self.speeds = speeds if speeds is not None else array('b')      # note speed
+        self.end_time = end_time                                # END line time (-1: no END line)
+        self.peak = peak                                        # most notes on screen at once (-1: not counted)
+        self.hash = None                                        # sha1 of the note data (replays)
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def note_count(self):
+        return len(self.types)
+
+    def add_row(self, time, enemies):
+        if self.end_time != END:                                # rows after END are never reached
+            return
+
+        if enemies[0] == END:
+            self.end_time = time
+            return
+
+        for enemy_type, enemy_line, enemy_speed in enemies:
+            self.types.append(enemy_type)
+            self.lanes.append(0 if enemy_line == LINE_UPPER else 1)
+            self.speeds.append(enemy_speed)
+
+        self.times.append(time)
+        self.starts.append(len(self.types))
+
+    @property
+    def peak_notes(self):
+        if self.peak < 0:
+            self.peak = peak_concurrency(self)
+
+        return self.peak
+
+    @property
+    def digest(self):                                           # same notes -> same digest (header not included)
+        if self.hash is None:
+            self.hash = hashlib.sha1(struct.pack("<q", self.end_time)
+                                     + self.to_bytes()[COMPILED_HEADER.size:]).digest()
+
+        return self.hash
+
+    def to_bytes(self, mtime_ns=0, size=0):
+        arrays = [self.times, self.starts, self.types, self.lanes, self.speeds]
+
+        if sys.byteorder == "big":
+            arrays = [array(a.typecode, a) for a in arrays]
+            for a in arrays:
+                a.byteswap()
+
+        return COMPILED_HEADER.pack(COMPILED_MAGIC, COMPILED_VERSION, mtime_ns, size, len(self.times),
+                                    len(self.types), self.end_time, self.peak_notes)\
+            + b"".join(a.tobytes() for a in arrays)
+
+    @classmethod
+    def from_buffer(cls, buffer, mtime_ns=None, size=None):    # None if stale or damaged
+        if len(buffer) < COMPILED_HEADER.size:
+            return None
+
+        magic, version, src_mtime, src_size, rows, notes, end_time, peak = COMPILED_HEADER.unpack_from(buffer)
+
+        if magic != COMPILED_MAGIC or version != COMPILED_VERSION\
+                or (mtime_ns is not None and src_mtime != mtime_ns) or (size is not None and src_size != size):
+            return None
+
+        chart = cls(array('i'), array('i'), array('b'), array('b'), array('b'), end_time, peak)
+        offset = COMPILED_HEADER.size
+
+        for a, count in ((chart.times, rows), (chart.starts, rows + 1), (chart.types, notes),
+                         (chart.lanes, notes), (chart.speeds, notes)):
+            end = offset + count * a.itemsize
+
+            if end > len(buffer):
+                return None
+
+            a.frombytes(buffer[offset:end])
+            offset = end
+
+            if sys.byteorder == "big":
+                a.byteswap()
+
+        return chart
+
+
+def screen_time(speed):                                         # ms from spawn until off the left edge
+    return (WIDTH + 50 + WIDTH) / (speed * 10) * 1000 / FPS
+
+
+def peak_concurrency(chart):                                    # most notes alive at once (ignores hits)
+    changes = list()
+
+    for row in range(len(chart.times)):
+        for i in range(chart.starts[row], chart.starts[row + 1]):
+            changes.append((chart.times[row], 1))
+            changes.append((chart.times[row] + screen_time(chart.speeds[i]), -1))
+
+    changes.sort()
+    alive = peak = 0
+
+    for change_time, change in changes:
+        alive += change
+        peak = max(peak, alive)
+
+    return peak
+
+
+def read_header(path):                                          # "score:<high>:<perfect>" -> (high, perfect)
+    with open(path, 'r', encoding="UTF-8") as song_file:
+        header = song_file.readline().rstrip('\n')
+
+    return int(header.split(':')[1]), int(header.split(':')[2])
+
+
+def parse_time(text):                                           # "MM:SS:CC" -> milliseconds
+    time_list = text.split(':')
+
+    if len(time_list) != 3:
+        raise ValueError("bad time: " + text)
+
+    return int(time_list[0]) * 60000 + int(time_list[1]) * 1000 + int(time_list[2]) * 10
+
+
+def format_time(ms):                                            # milliseconds -> "MM:SS:CC"
+    return "%02d:%02d:%02d" % (ms // 60000, ms // 1000 % 60, ms // 10 % 100)
+
+
+def parse_enemy(text):                                          # "1U3" -> (type, line, speed), "E..." -> END
+    if text[:1] == 'E':
+        return END
+
+    if len(text) < 3 or text[0] not in "123" or text[1] not in "UL" or text[2] not in "123456789":
+        raise ValueError("bad enemy: " + text)
+
+    return int(text[0]), LINE_UPPER if text[1] == 'U' else LINE_LOWER, int(text[2])
+
+
+def parse_line(data_line):                                      # "MM:SS:CC - 1U3, 2L4" -> [time, enemy, ...]
+    data_fileList = data_line.split(" - ")
+
+    if len(data_fileList) != 2:
+        raise ValueError("bad line: " + data_line)
+
+    current_songData = [parse_time(data_fileList[0])]
+
+    for enemy in data_fileList[1].split(", "):
+        current_songData.append(parse_enemy(enemy))
+
+    if END in current_songData[2:]:
+        raise ValueError("END mixed with enemies: " + data_line)
+
+    return current_songData
+
+
+def parse_chart(lines, errors=None):
+    chart = Chart()
+
+    for line_num, data_line in enumerate(lines, 1):
+        if data_line != '' and data_line[0] != 's':
+            try:
+                current_songData = parse_line(data_line)
+            except (ValueError, IndexError) as e:
+                if errors is None:
+                    raise
+                errors.append((line_num, data_line, str(e)))
+                continue
+
+            chart.add_row(current_songData[0], current_songData[1:])
+
+    return chart
+
+
+def load_chart(path, errors=None):                              # parse the text chart
+    with open(path, 'r', encoding="UTF-8") as data_file:
+        return parse_chart(data_file.read().split('\n'), errors)
+
+
+def compiled_path(path):
+    return os.path.splitext(path)[0] + COMPILED_EXT
+
+
+def load_compiled(path, errors=None):                           # compiled chart, rebuilt when the .ini changes
+    stat = os.stat(path)
+    chart_path = compiled_path(path)
+
+    try:
+        with open(chart_path, 'rb') as chart_file:
+            with mmap.mmap(chart_file.fileno(), 0, access=mmap.ACCESS_READ) as chart_map:
+                with memoryview(chart_map) as chart_view:
+                    chart = Chart.from_buffer(chart_view, stat.st_mtime_ns, stat.st_size)
+    except (OSError, ValueError):                               # missing or empty compiled file
+        chart = None
+
+    if chart is None:
+        chart = compile_chart(path, errors, stat)
+
+    return chart
+
+
+def compile_chart(path, errors=None, stat=None):
+    stat = stat if stat is not None else os.stat(path)
+    chart = load_chart(path, errors if errors is not None else list())
+    chart_path = compiled_path(path)
+    temp_path = chart_path + ".tmp"
+
+    try:
+        with open(temp_path, 'wb') as chart_file:
+            chart_file.write(chart.to_bytes(stat.st_mtime_ns, stat.st_size))
+
+        os.replace(temp_path, chart_path)
+    except OSError:                                             # read-only song folder: keep it in memory
+        pass
+
+    return chart
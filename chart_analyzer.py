@@ -0,0 +1,144 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from settings import *
+from chart import END, Chart, load_chart, screen_time
+from simulation import Note, Simulation
+
+NPS_WINDOWS = (1000, 5000)                                      # ms, sliding windows for notes per second
+DIFFICULTY_WEIGHTS = (0.6, 0.4)                                 # p95 of the 1 s windows, peak of the 5 s windows
+SWITCH_WEIGHT = 0.5                                             # lane changes make the same density harder
+
+
+def travel_table(target_size=TARGET_SIZE):                      # [lane, type, speed] -> ms from spawn to the target
+    sim = Simulation(Chart(), target_size)
+    table = np.zeros((2, len(ENEMY_SIZE) + 1, 10))
+
+    for lane in range(2):
+        for enemy_type in range(1, len(ENEMY_SIZE) + 1):
+            for speed in range(1, 10):
+                table[lane, enemy_type, speed] = sim.travel_time(Note().reset(-1, enemy_type, lane, speed, 0))
+
+    return table
+
+
+def analyze(chart, malformed=(), target_size=TARGET_SIZE):     # note density and difficulty of one chart
+    times = np.frombuffer(chart.times, dtype=np.int32).astype(np.float64)
+    counts = np.diff(np.frombuffer(chart.starts, dtype=np.int32))
+    types = np.frombuffer(chart.types, dtype=np.int8)
+    lanes = np.frombuffer(chart.lanes, dtype=np.int8)
+    speeds = np.frombuffer(chart.speeds, dtype=np.int8)
+    notes = len(types)
+    duration = chart.end_time if chart.end_time != END else (int(times[-1]) if len(times) else 0)
+    report = {"notes": notes, "duration_ms": duration, "nps_mean": 0.0, "peak_on_screen": 0, "upper_ratio": 0.0,
+              "switch_rate": 0.0, "difficulty": 0.0, "malformed": len(malformed),
+              "malformed_lines": [line_num for line_num, data_line, message in malformed]}
+
+    for window in NPS_WINDOWS:
+        report["nps_%ds" % (window // 1000)] = 0.0
+
+    report["nps_1s_p95"] = 0.0
+
+    if notes == 0:
+        return report
+
+    spawns = np.repeat(times, counts)                           # per note, chart order
+    hits = spawns + travel_table(target_size)[lanes, types, speeds]
+    order = np.argsort(hits, kind="stable")
+    hits = hits[order]
+    index = np.arange(notes)
+
+    for window in NPS_WINDOWS:                                  # notes in [hit, hit + window) for every note
+        window_counts = np.searchsorted(hits, hits + window) - index
+        report["nps_%ds" % (window // 1000)] = float(window_counts.max() * 1000 / window)
+
+        if window == 1000:
+            report["nps_1s_p95"] = float(np.percentile(window_counts, 95))
+
+    spawns = np.sort(spawns)                                    # on screen from spawn until off the left edge
+    leaves = np.sort(spawns + screen_time(speeds.astype(np.float64)))
+    report["peak_on_screen"] = int((index + 1 - np.searchsorted(leaves, spawns, side="right")).max())
+
+    ordered_lanes = lanes[order]
+    report["upper_ratio"] = float(np.count_nonzero(lanes == 0) / notes)
+    report["switch_rate"] = float(np.count_nonzero(ordered_lanes[1:] != ordered_lanes[:-1]) / max(notes - 1, 1))
+    report["nps_mean"] = float(notes * 1000 / max(hits[-1] - hits[0], 1000))
+    density = DIFFICULTY_WEIGHTS[0] * report["nps_1s_p95"] + DIFFICULTY_WEIGHTS[1] * report["nps_5s"]
+    report["difficulty"] = round(density * (1 + SWITCH_WEIGHT * report["switch_rate"]), 1)
+    return report
+
+
+def analyze_file(path):                                         # report for one chart (process pool worker)
+    start = time.perf_counter()
+    report = {"chart": path, "error": ""}
+
+    try:
+        malformed = list()
+        report.update(analyze(load_chart(path, malformed), malformed))
+    except (OSError, ValueError) as e:
+        report["error"] = str(e)
+
+    report["wall_ms"] = (time.perf_counter() - start) * 1000
+    return report
+
+
+def chart_paths(paths):                                         # files as given, directories expanded
+    for path in paths:
+        if os.path.isdir(path):
+            for chart_name in sorted(os.listdir(path)):
+                if chart_name.endswith(".ini"):
+                    yield os.path.join(path, chart_name)
+        else:
+            yield path
+
+
+def analyze_all(paths, workers=None):
+    paths = list(chart_paths(paths))
+
+    if workers == 1 or len(paths) < 2:
+        return [analyze_file(path) for path in paths]
+
+    with ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(analyze_file, paths))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Muse Rush chart analyzer (density, concurrency, difficulty)")
+    parser.add_argument("charts", nargs='*', default=[os.path.join(os.path.dirname(os.path.abspath(__file__)), "song")],
+                        help="chart files or directories")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: cpu count, 1: no pool)")
+    parser.add_argument("--output", default="", help="write the reports as json")
+    args = parser.parse_args(argv[1:])
+
+    start = time.perf_counter()
+    reports = analyze_all(args.charts, args.workers)
+    failed = 0
+
+    for report in reports:
+        if report["error"]:
+            print("%s: %s" % (os.path.basename(report["chart"]), report["error"]))
+            failed += 1
+        else:
+            print("%s: level %.1f, %d notes, %.1f nps (1 s peak %.0f, 5 s peak %.1f), %d on screen, upper %.0f%%,"
+                  " %d malformed lines" % (os.path.basename(report["chart"]), report["difficulty"], report["notes"],
+                                           report["nps_mean"], report["nps_1s"], report["nps_5s"],
+                                           report["peak_on_screen"], report["upper_ratio"] * 100,
+                                           report["malformed"]))
+
+    print("%d charts, %.1f ms" % (len(reports), (time.perf_counter() - start) * 1000))
+
+    if args.output:
+        with open(args.output, 'w', encoding="UTF-8") as output_file:
+            json.dump(reports, output_file, indent=1)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,343 @@
+import os
+import sys
+import math
+import time
+import wave
+import bisect
+import shutil
+import argparse
+import subprocess
+from array import array
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from settings import *
+from chart import END, Chart, format_time, parse_chart
+from simulation import PERFECT, Note, Simulation, run
+from library import MUSIC_TYPE
+
+ANALYSIS_RATE = 22050                                           # decode rate of ffmpeg (wav: file rate)
+CHUNK_SECONDS = 4                                               # decoded audio held in memory at once
+LOW_BAND = 200                                                  # Hz: onsets led by the band below go to the lower lane
+ONSET_THRESHOLD = 0.6                                           # peak height over the local mean (flux std units)
+MIN_GAP = 120                                                   # ms between generated notes
+SNAP_MS = 50                                                    # onsets this close to a beat are moved onto it
+BPM_RANGE = (60, 200)
+TIGHTNESS = 100                                                 # beat tracker: cost of straying from the tempo
+
+
+def wav_chunks(wav_file, chunk_seconds):                        # PCM wav, read chunk by chunk
+    channels, width = wav_file.getnchannels(), wav_file.getsampwidth()
+    chunk_frames = int(wav_file.getframerate() * chunk_seconds)
+
+    with wav_file:
+        while True:
+            data = wav_file.readframes(chunk_frames)
+
+            if not data:
+                break
+
+            if width == 1:
+                samples = (np.frombuffer(data, np.uint8).astype(np.float32) - 128) / 128
+            elif width == 3:
+                raw = np.frombuffer(data, np.uint8).reshape(-1, 3).astype(np.int32)
+                samples = ((raw[:, 0] | raw[:, 1] << 8 | raw[:, 2] << 16) << 8 >> 8).astype(np.float32) / 2 ** 23
+            else:
+                samples = np.frombuffer(data, "<i" + str(width)).astype(np.float32) / 2 ** (8 * width - 1)
+
+            yield samples.reshape(-1, channels).mean(axis=1)
+
+
+def ffmpeg_chunks(path, rate, chunk_seconds):                   # any format ffmpeg reads, piped as mono s16
+    process = subprocess.Popen(["ffmpeg", "-v", "error", "-i", path, "-f", "s16le", "-ac", "1", "-ar", str(rate),
+                                "-"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    try:
+        while True:
+            data = process.stdout.read(int(rate * chunk_seconds) * 2)
+
+            if not data:
+                break
+
+            yield np.frombuffer(data[:len(data) // 2 * 2], "<i2").astype(np.float32) / 32768
+    finally:
+        process.kill()
+        process.wait()
+
+
+def open_track(path, chunk_seconds=CHUNK_SECONDS):              # (sample rate, chunk iterator), never decoded whole
+    if path.lower().endswith(".wav"):
+        try:
+            wav_file = wave.open(path, 'rb')
+            return wav_file.getframerate(), wav_chunks(wav_file, chunk_seconds)
+        except (wave.Error, EOFError):                          # float / compressed wav: through ffmpeg
+            pass
+
+    if shutil.which("ffmpeg") is None:
+        raise ValueError("ffmpeg required for streaming (only PCM wav is read without it)")
+
+    return ANALYSIS_RATE, ffmpeg_chunks(path, ANALYSIS_RATE, chunk_seconds)
+
+
+class OnsetDetector:                                            # Streaming STFT Spectral Flux
+    def __init__(self, rate):
+        self.rate = rate
+        self.hop = 2 ** round(math.log2(rate / 43))             # ~23 ms (512 samples at 22050 Hz)
+        self.size = self.hop * 2
+        self.frame_ms = self.hop * 1000 / rate
+        self.window = np.hanning(self.size).astype(np.float32)
+        self.split = max(1, int(LOW_BAND * self.size / rate))   # first bin of the high band
+        self.tail = np.zeros(self.size - self.hop, np.float32)  # samples shared with the next chunk
+        self.last = None                                        # log spectrum of the previous frame
+        self.low = array('f')                                   # flux per frame (4 bytes each: 10 KB per minute)
+        self.high = array('f')
+        self.samples = 0
+
+    def feed(self, samples):
+        self.samples += len(samples)
+        buffer = np.concatenate([self.tail, samples.astype(np.float32)])
+        count = (len(buffer) - self.size) // self.hop + 1
+
+        if count <= 0:
+            self.tail = buffer
+            return
+
+        frames = sliding_window_view(buffer, self.size)[::self.hop][:count]
+        spectrum = np.log1p(100 * np.abs(np.fft.rfft(frames * self.window, axis=1)))
+        last = spectrum[:1] if self.last is None else self.last[np.newaxis]
+        flux = np.maximum(spectrum - np.concatenate([last, spectrum[:-1]]), 0)
+        self.low.frombytes(flux[:, :self.split].sum(axis=1).astype(np.float32).tobytes())
+        self.high.frombytes(flux[:, self.split:].sum(axis=1).astype(np.float32).tobytes())
+        self.last = spectrum[-1]
+        self.tail = buffer[count * self.hop:]
+
+    def envelopes(self):                                        # (low band flux, high band flux) per frame
+        return np.frombuffer(self.low, np.float32).astype(np.float64),\
+            np.frombuffer(self.high, np.float32).astype(np.float64)
+
+
+def tempo_period(envelope, frame_ms):                           # beat period (frames) from the autocorrelation
+    centered = envelope - envelope.mean()
+    size = 1 << (2 * len(centered) - 1).bit_length()
+    spectrum = np.fft.rfft(centered, size)
+    correlation = np.fft.irfft(spectrum * np.conj(spectrum), size)[:len(centered)]
+    lags = np.arange(max(1, int(60000 / BPM_RANGE[1] / frame_ms)),
+                     min(len(centered) - 1, int(60000 / BPM_RANGE[0] / frame_ms)) + 1)
+
+    if len(lags) == 0:
+        return 500 / frame_ms
+
+    weighted = correlation[lags] * np.exp(-0.5 * np.log2(lags * frame_ms / 500) ** 2)    # prefer ~120 BPM
+    best = int(np.argmax(weighted))
+
+    if 0 < best < len(lags) - 1:                                # parabolic peak between lags
+        left, middle, right = weighted[best - 1:best + 2]
+        curve = left - 2 * middle + right
+
+        if curve < 0:
+            return lags[best] + 0.5 * (left - right) / curve
+
+    return float(lags[best])
+
+
+def track_beats(envelope, frame_ms):                            # beat frames (dynamic programming)
+    period = tempo_period(envelope, frame_ms)
+    low, high = max(1, int(round(period / 2))), max(2, int(round(period * 2)))
+    penalty = -TIGHTNESS * np.log(np.arange(high, low - 1, -1) / period) ** 2    # gap high .. low
+    score = envelope / (envelope.std() or 1)
+    back = np.full(len(score), -1)
+
+    for t in range(low, len(score)):
+        start = max(0, t - high)
+        candidates = score[start:t - low + 1] + penalty[len(penalty) - (t - low + 1 - start):]
+        best = int(np.argmax(candidates))
+
+        if candidates[best] > 0:
+            score[t] += candidates[best]
+            back[t] = start + best
+
+    t = len(score) - 1 - int(np.argmax(score[::-1][:int(period) + 1]))
+    beats = list()
+
+    while t >= 0:
+        beats.append(t)
+        t = back[t]
+
+    return np.array(beats[::-1]), float(60000 / (period * frame_ms))
+
+
+def pick_onsets(envelope, frame_ms, density):                   # (onset frames, strength), strongest first kept
+    normalized = envelope / (envelope.std() or 1)
+    mean_width = max(1, int(500 / frame_ms))
+    local = np.convolve(normalized, np.ones(2 * mean_width + 1) / (2 * mean_width + 1), "same")
+    peak_width = max(1, int(30 / frame_ms))
+    local_max = sliding_window_view(np.pad(normalized, peak_width), 2 * peak_width + 1).max(axis=1)
+    candidates = np.flatnonzero((normalized == local_max) & (normalized > local + ONSET_THRESHOLD))
+    strengths = normalized[candidates] - local[candidates]
+    limit = int(density * len(envelope) * frame_ms / 1000)
+    gap = MIN_GAP / frame_ms
+    taken = list()
+
+    for i in np.argsort(-strengths, kind="stable"):
+        if len(taken) >= limit:
+            break
+
+        index = bisect.bisect(taken, candidates[i])
+
+        if (index == 0 or candidates[i] - taken[index - 1] >= gap)\
+                and (index == len(taken) or taken[index] - candidates[i] >= gap):
+            taken.insert(index, candidates[i])
+
+    onsets = np.array(taken, dtype=np.int64)
+    return onsets, normalized[onsets] - local[onsets]
+
+
+def generate(path, speed=4, density=4, chunk_seconds=CHUNK_SECONDS):    # chart text + report for one track
+    rate, chunks = open_track(path, chunk_seconds)
+    detector = OnsetDetector(rate)
+
+    for samples in chunks:
+        detector.feed(samples)
+
+    low, high = detector.envelopes()
+    duration = detector.samples * 1000 // rate
+    report = {"duration_ms": duration, "notes": 0, "bpm": 0}
+
+    if len(low) < 2:
+        return "", report
+
+    low, high = low / (low.mean() or 1), high / (high.mean() or 1)
+    envelope = low + high
+    beats, report["bpm"] = track_beats(envelope, detector.frame_ms)
+    onsets, strengths = pick_onsets(envelope, detector.frame_ms, density)
+    beat_times = (beats + 1) * detector.frame_ms
+    types = np.digitize(strengths, np.quantile(strengths, [0.5, 0.85])) + 1 if len(strengths) else strengths
+    sim = Simulation(Chart())
+    travel = dict()
+    rows = dict()                                               # row time -> {lane: enemy}
+    last_hit = -MIN_GAP
+
+    for onset, enemy_type in zip(onsets, types):
+        hit_time = (onset + 1) * detector.frame_ms              # frame centre
+        beat = bisect.bisect(beat_times, hit_time)
+
+        for beat_time in beat_times[max(0, beat - 1):beat + 1]:
+            if abs(beat_time - hit_time) <= SNAP_MS:
+                hit_time = beat_time
+                break
+
+        if hit_time - last_hit < MIN_GAP / 2:                   # two onsets snapped onto one beat
+            continue
+
+        lane = 1 if low[onset] > high[onset] else 0
+        key = (int(enemy_type), lane)
+
+        if key not in travel:
+            travel[key] = sim.travel_time(Note().reset(-1, key[0], lane, speed, 0))
+
+        row_time = int(round((hit_time - travel[key]) / 10)) * 10
+
+        if row_time < 0:
+            continue
+
+        rows.setdefault(row_time, dict()).setdefault(lane, str(key[0]) + "UL"[lane] + str(speed))
+        last_hit = hit_time
+
+    lines = [format_time(row_time) + " - " + ", ".join(rows[row_time][lane] for lane in sorted(rows[row_time]))
+             for row_time in sorted(rows)]
+    report["notes"] = sum(len(row) for row in rows.values())
+    end_time = int(math.ceil(max(duration, last_hit + 1000) / 10)) * 10
+    lines.append(format_time(end_time) + " - END")
+    return "score:0:" + str(report["notes"] * PERFECT) + "\n\n" + "\n".join(lines) + "\n", report
+
+
+def generate_file(path, speed=4, density=4, force=False, chunk_seconds=CHUNK_SECONDS):     # process pool worker
+    chart_path = os.path.splitext(path)[0] + ".ini"
+    report = {"track": path, "chart": chart_path, "error": ""}
+
+    if os.path.exists(chart_path) and not force:
+        report["error"] = "chart exists (--force to replace it)"
+        return report
+
+    start = time.perf_counter()
+
+    try:
+        chart_text, result = generate(path, speed, density, chunk_seconds)
+    except (OSError, ValueError, EOFError) as e:
+        report["error"] = str(e)
+        return report
+
+    report.update(result)
+    report["wall_ms"] = (time.perf_counter() - start) * 1000
+
+    if report["notes"] == 0:
+        report["error"] = "no onsets found"
+        return report
+
+    chart = parse_chart(chart_text.split('\n')[2:])             # autoplay must clear the generated chart
+    report["autoplay_score"] = run(chart, autoplay=True).score
+
+    if chart.end_time == END or report["autoplay_score"] != report["notes"] * PERFECT:
+        report["error"] = "autoplay score " + str(report["autoplay_score"]) + " != " + str(report["notes"] * PERFECT)
+        return report
+
+    temp_path = chart_path + ".tmp"
+
+    try:
+        with open(temp_path, 'w', encoding="UTF-8") as chart_file:
+            chart_file.write(chart_text)
+
+        os.replace(temp_path, chart_path)
+    except OSError as e:
+        report["error"] = str(e)
+
+    return report
+
+
+def track_paths(paths):                                         # files as given, directories expanded
+    for path in paths:
+        if os.path.isdir(path):
+            for track in sorted(os.listdir(path)):
+                if track.split('.')[-1] in MUSIC_TYPE:
+                    yield os.path.join(path, track)
+        else:
+            yield path
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Muse Rush chart generator (onset / beat detection)")
+    parser.add_argument("tracks", nargs='*', default=[os.path.join(os.path.dirname(os.path.abspath(__file__)), "song")],
+                        help="audio files or directories (the chart is written next to the track)")
+    parser.add_argument("--speed", type=int, default=4, choices=range(1, 10), help="enemy speed (1-9)")
+    parser.add_argument("--density", type=float, default=4, help="most notes per second")
+    parser.add_argument("--force", action="store_true", help="replace existing charts")
+    parser.add_argument("--chunk-seconds", type=float, default=CHUNK_SECONDS, help="decoded audio held at once")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: cpu count, 1: no pool)")
+    args = parser.parse_args(argv[1:])
+    paths = list(track_paths(args.tracks))
+    jobs = (paths, repeat(args.speed), repeat(args.density), repeat(args.force), repeat(args.chunk_seconds))
+
+    if args.workers == 1 or len(paths) < 2:
+        reports = list(map(generate_file, *jobs))
+    else:
+        with ProcessPoolExecutor(args.workers) as executor:
+            reports = list(executor.map(generate_file, *jobs))
+
+    failed = 0
+
+    for report in reports:
+        if report["error"]:
+            print("%s: %s" % (os.path.basename(report["track"]), report["error"]))
+            failed += 0 if report["error"].startswith("chart exists") else 1
+        else:
+            print("%s: %d notes, %.0f BPM, %.1f s, %.0f ms" % (os.path.basename(report["track"]), report["notes"],
+                  report["bpm"], report["duration_ms"] / 1000, report["wall_ms"]))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,70 @@
+import time
+import pygame
+
+
+def display_rate(default):                                      # refresh rate of the window's display (Hz)
+    refresh_rate = getattr(pygame.display, "get_current_refresh_rate", None)    # pygame-ce only
+
+    try:
+        rate = refresh_rate() if refresh_rate is not None else 0
+    except pygame.error:
+        rate = 0
+
+    if rate <= 0:
+        print("error: display refresh rate is unknown (needs pygame-ce), frames are paced at " + str(default) + " fps")
+
+    return rate or default
+
+
+class FramePacer:                                               # Frame Deadlines and Fixed Logic Steps
+    def __init__(self, frame_rate, step_rate, busy_ms=0, max_steps=5):
+        self.frame_s = 1 / frame_rate if frame_rate > 0 else 0  # 0: uncapped
+        self.step_ms = 1000 / step_rate                         # menu logic runs in steps of this length
+        self.busy_s = busy_ms / 1000                            # spin instead of sleeping this close to the deadline
+        self.max_steps = max_steps                              # after a stall: skip, don't replay every step
+        self.last = time.perf_counter()
+        self.deadline = self.last + self.frame_s
+        self.accumulator = 0.0                                  # ms not stepped yet
+        self.steps = 0                                          # steps due this frame
+        self.frames = 0
+        self.missed = 0                                         # frames whose work ran past their deadline
+        self.late = False                                       # the current frame missed its deadline
+
+    def wait(self, poller):                                     # sleep until the frame deadline, polling input
+        if self.frame_s > 0:
+            while True:
+                poller.poll()
+                now = time.perf_counter()
+                remain = self.deadline - now - self.busy_s
+
+                if remain <= 0:
+                    break
+
+                pygame.time.wait(max(min(poller.poll_ms, int(remain * 1000)), 1))
+
+            while now < self.deadline:                          # tick_busy_loop: exact deadline, costs a core
+                now = time.perf_counter()
+
+            if now - self.deadline > self.frame_s:              # a frame or more behind: start over from now
+                self.deadline = now + self.frame_s
+            else:
+                self.deadline += self.frame_s
+        else:
+            poller.poll()
+            now = time.perf_counter()
+
+        self.frames += 1
+        self.accumulator = min(self.accumulator + (now - self.last) * 1000, self.step_ms * self.max_steps)
+        self.last = now
+        self.steps = int(self.accumulator // self.step_ms)
+        self.accumulator -= self.steps * self.step_ms
+        return self.steps
+
+    def presented(self):                                        # after present: True if the frame ran past its deadline
+        self.late = self.frame_s > 0 and time.perf_counter() > self.deadline
+        self.missed += self.late
+        return self.late
+
+    @property
+    def alpha(self):                                            # 0 - 1: way from the last step to the next
+        return self.accumulator / self.step_ms
@@ -0,0 +1,23 @@
+import pygame
+from collections import deque
+
+
+class InputPoller:                                              # Timestamped Event Queue
+    def __init__(self, poll_ms=1):
+        self.poll_ms = poll_ms                                  # poll interval while waiting for the next frame
+        self.events = deque()                                   # (tick, event), filled in arrival order
+
+    def poll(self):
+        tick = pygame.time.get_ticks()
+
+        for event in pygame.event.get():
+            self.events.append((getattr(event, "timestamp", tick), event))     # SDL timestamp when exposed
+
+    def drain(self):
+        self.poll()
+        events = list()
+
+        while self.events:
+            events.append(self.events.popleft())
+
+        return events
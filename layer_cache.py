@@ -0,0 +1,35 @@
+import pygame
+from collections import OrderedDict
+
+
+class LayerCache:                                               # Pre-Composed Static Screen Layers
+    def __init__(self, size, max_entries=20):
+        self.size = size
+        self.max_entries = max_entries                          # full screen surfaces (1280x720: 3.5 MB each)
+        self.layers = OrderedDict()                             # key -> opaque Surface (LRU order)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compose):                                # compose(surface) draws the layer on a miss
+        layer = self.layers.get(key)
+
+        if layer is not None:
+            self.layers.move_to_end(key)
+            self.hits += 1
+            return layer
+
+        self.misses += 1
+        layer = pygame.Surface(self.size).convert()
+        compose(layer)
+        self.layers[key] = layer
+
+        if len(self.layers) > self.max_entries:
+            self.layers.popitem(last=False)
+
+        return layer
+
+    def clear(self):
+        self.layers.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.layers)}
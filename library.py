@@ -0,0 +1,158 @@
+import os
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from chart import END, compile_chart, read_header
+
+try:
+    from chart_analyzer import analyze
+except ImportError:                                             # no numpy: songs are listed without the analysis
+    analyze = None
+
+MUSIC_TYPE = ["ogg", "mp3", "wav"]
+INDEX_NAME = "library.json"
+INDEX_VERSION = 2
+
+
+class SongLibrary:                                              # Persistent Song Index
+    def __init__(self, song_dir, index_path=None, workers=1):
+        self.song_dir = song_dir
+        self.index_path = index_path if index_path is not None else os.path.join(song_dir, INDEX_NAME)
+        self.workers = workers                                  # chart scan processes (1: in-process, None: cpu count;
+                                                                # the game keeps 1: no fork after SDL / mixer init)
+        self.entries = dict()                                   # song file name -> entry
+        self.lock = threading.Lock()
+        self.ready = threading.Event()                          # set when a scan has finished (or failed)
+        self.error = None                                       # exception of the last background scan
+        self.rescanned = 0                                      # files probed / parsed by the last scan
+        self.load_index()
+
+    def load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding="UTF-8") as index_file:
+                index = json.load(index_file)
+
+            if index.get("version") == INDEX_VERSION:
+                self.entries = index["songs"]
+        except (OSError, ValueError, KeyError):
+            self.entries = dict()
+
+    def save_index(self):
+        with self.lock:
+            index = {"version": INDEX_VERSION, "songs": self.entries}
+
+        temp_path = self.index_path + ".tmp"
+
+        try:
+            with open(temp_path, 'w', encoding="UTF-8") as index_file:
+                json.dump(index, index_file, indent=1, sort_keys=True)
+
+            os.replace(temp_path, self.index_path)
+        except OSError:                                         # read-only song folder: keep it in memory
+            pass
+
+    def scan(self, probe=None):                                 # probe(path) -> True if the file can be played
+        entries = dict()
+        rescanned = 0
+        jobs = list()                                           # (song, chart path, chart stat) to scan
+
+        with os.scandir(self.song_dir) as dir_entries:
+            files = {i.name: i.stat() for i in dir_entries if i.is_file()}
+
+        for song in sorted(files):
+            if song.split('.')[-1] not in MUSIC_TYPE:
+                continue
+
+            song_stat = files[song]
+            chart_name = song.split('.')[0] + ".ini"
+            chart_stat = files.get(chart_name)
+            entry = self.entries.get(song)
+
+            if entry is None or entry["size"] != song_stat.st_size or entry["mtime_ns"] != song_stat.st_mtime_ns:
+                entry = {"name": song.split('.')[0], "size": song_stat.st_size, "mtime_ns": song_stat.st_mtime_ns,
+                         "playable": probe(os.path.join(self.song_dir, song)) if probe is not None else True,
+                         "chart": None}
+                rescanned += 1
+            else:
+                entry = dict(entry)
+
+            chart = entry["chart"]
+
+            if chart_stat is None:
+                entry["chart"] = None
+            elif chart is None or chart["size"] != chart_stat.st_size or chart["mtime_ns"] != chart_stat.st_mtime_ns:
+                jobs.append((song, os.path.join(self.song_dir, chart_name), chart_stat))
+                rescanned += 1
+
+            entries[song] = entry
+
+        charts = self.scan_charts([i[1] for i in jobs], [i[2] for i in jobs])
+
+        for (song, chart_path, chart_stat), chart in zip(jobs, charts):
+            entries[song]["chart"] = chart
+
+        changed = rescanned > 0 or entries.keys() != self.entries.keys()
+
+        with self.lock:
+            self.entries = entries
+            self.rescanned = rescanned
+
+        if changed:
+            self.save_index()
+
+        self.ready.set()
+        return self.songs()
+
+    def scan_async(self, probe=None):                           # rescan in a background thread
+        self.ready.clear()
+        self.error = None
+        thread = threading.Thread(target=self.scan_thread, args=(probe,), daemon=True)
+        thread.start()
+        return thread
+
+    def scan_thread(self, probe):                               # errors are kept for the main thread (check)
+        try:
+            self.scan(probe)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.ready.set()
+
+    def check(self):                                            # main thread: raises the background scan's error
+        if self.error is not None:
+            raise self.error
+
+    def scan_charts(self, chart_paths, chart_stats):            # changed charts, across a process pool
+        sizes = [i.st_size for i in chart_stats]
+        mtimes = [i.st_mtime_ns for i in chart_stats]
+
+        if self.workers == 1 or len(chart_paths) < 2:
+            return list(map(scan_chart, chart_paths, sizes, mtimes))
+
+        with ProcessPoolExecutor(self.workers) as executor:
+            return list(executor.map(scan_chart, chart_paths, sizes, mtimes))
+
+    def songs(self):                                            # playable entries in name order
+        with self.lock:
+            return [dict(self.entries[i], file=i) for i in sorted(self.entries) if self.entries[i]["playable"]]
+
+
+def scan_chart(chart_path, size, mtime_ns):                     # header, notes and analysis (process pool worker)
+    chart = {"path": os.path.basename(chart_path), "size": size, "mtime_ns": mtime_ns, "high_score": -1,
+             "perfect_score": -1, "notes": 0, "duration": 0, "analysis": None}
+
+    try:
+        chart["high_score"], chart["perfect_score"] = read_header(chart_path)
+        malformed = list()
+        song_chart = compile_chart(chart_path, malformed)      # the .ini changed: .mrc rebuilt, malformed lines seen
+        chart["notes"] = song_chart.note_count
+        chart["duration"] = song_chart.end_time if song_chart.end_time != END\
+            else (song_chart.times[-1] if len(song_chart) else 0)
+
+        if analyze is not None:
+            chart["analysis"] = analyze(song_chart, malformed)
+    except (OSError, ValueError, IndexError):
+        chart["high_score"] = -1
+        chart["perfect_score"] = -1
+
+    return chart
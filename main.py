@@ -1,44 +1,85 @@
 import pygame
 from pygame.locals import *
+import copy
+import io
 import os
-import time
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from settings import *
+from text_cache import TextCache
+from sprite_atlas import SpriteAtlas
+from layer_cache import LayerCache
+from chart import END, load_compiled, format_time
+from simulation import Simulation, MISS
+from replay import Replay, replay_name
+from telemetry import Telemetry, HISTOGRAM_BIN
+from library import SongLibrary
+from score_store import ScoreStore
+from input_poller import InputPoller
+from profiler import FrameProfiler, STAGES
+from voices import VoiceManager
+from song_clock import SongClock
+from pcm_cache import load_pcm
+from startup import StartupTimer
+from frame_pacer import FramePacer, display_rate
 
-TITLE = "Muse Rush"                                             # default setting
-WIDTH = 1280
-HEIGHT = 720
-FPS = 60
-DEFAULT_FONT = "Excludeditalic-jEr99.ttf"
-
-WHITE = (255, 255, 255)                                         # color setting
-BLACK = (32, 36, 32)
-RED = (246, 36, 74)
-BLUE = (32, 105, 246)
-ALPHA_MAX = 255     # do not change (fix 255)
 
 class MuseRush:
     def __init__(self):                                         # Game Start
-        pygame.init()
+        self.startup = StartupTimer()                           # time to first frame / to the main screen
+        pygame.mixer.pre_init(AUDIO_FREQUENCY, -16, 2, AUDIO_BUFFER)   # low latency mixer, before the mixer init
+        pygame.display.init()                                   # only the modules in use (pygame.init also starts
+        pygame.font.init()                                      # joystick, freetype, ...)
         pygame.mixer.init()                                     # sound mixer
+        pygame.mixer.set_num_channels(AUDIO_CHANNELS)
+        self.startup.mark("modules")
         pygame.display.set_caption(TITLE)                       # title name
-        self.screen = pygame.display.set_mode((WIDTH, HEIGHT))  # screen size
+        self.window = pygame.display.set_mode((WIDTH, HEIGHT))  # screen size (layout units: WIDTH x HEIGHT)
+        self.render_scale = RENDER_SCALE                        # internal resolution
+        self.screen = self.window if self.render_scale == 1 else\
+            pygame.Surface((self.px(WIDTH), self.px(HEIGHT))).convert()    # frame buffer, scaled to the window
+        self.startup.mark("window")
         self.screen_mode = 0        # screen mode (0: logo1, 1: logo2, 2: main, 3: stage select, 4: play, 5: score)
         self.screen_value = [-ALPHA_MAX, 0, 0, 0]               # screen management value
         self.clock = pygame.time.Clock()                        # FPS timer
+        self.input = InputPoller()                              # input polled between frames
+        self.pacer = FramePacer(FRAME_RATE if FRAME_RATE >= 0 else display_rate(FPS), FPS, FRAME_BUSY_MS,
+                                FRAME_STEPS_MAX)                # render rate apart from the FPS logic steps
+        self.steps = 1                                          # logic steps due this frame (fades, logo pulse)
+        self.fade_rate = 0                                      # screen_value[0] per step of the running fade
+        self.profiler = FrameProfiler(PROFILE_FRAMES)           # per-stage frame timer (F3: overlay)
+        self.profile_surface = None                             # overlay text, refreshed every 30 frames
         self.start_tick = 0                                     # game timer
+        self.countdown_tick = 0                                 # play screen countdown end (0: playing)
+        self.hold_tick = 0                                      # play -> score screen wait end
+        self.loader = None                                      # chart / song preload (Future)
+        self.loader_pool = ThreadPoolExecutor(1)
+        self.song_buffer = None                                 # preloaded song file (music stream source)
+        self.practice = False                                   # practice mode: seek, A-B loop, no score saved
+        self.drawn_mode = -1                                    # screen mode of the last drawn frame
+        self.dirty_rects = None                                 # changed regions of the last frame (None: all)
+        self.hud_rects = list()                                 # play screen text regions of the last frame
         self.running = True                                     # game initialize boolean value
         self.language_mode = 0                                  # 0: english
         self.song_select = 1                                    # select song
+        self.enemy_pool = list()                                # reusable Enemy sprites
+        self.loaded = False                                     # assets and song library ready (logo1 waits)
+        self.asset_pool = ThreadPoolExecutor(ASSET_WORKERS)     # png / wav decode
+        self.sim = None                                         # logo screens run before new()
+        self.all_sprites = pygame.sprite.RenderUpdates()
+        self.enemys = pygame.sprite.Group()
         self.load_data()                                        # data loading
-        self.new()
-        pygame.mixer.music.load(self.bg_main)                   # bgm
+        self.startup.mark("logo")
 
-    def load_data(self):                                        #Data Loading
+    def load_data(self):                                        #Data Loading (logo screen now, the rest meanwhile)
         self.dir = os.path.dirname(__file__)
 
         # font
         self.font_dir = os.path.join(self.dir, "font")
         self.gameFont = os.path.join(self.font_dir, DEFAULT_FONT)
+        self.text_cache = TextCache(os.path.join(self.font_dir, DEFAULT_FONT),
+                                    scale=self.render_scale)    # font pool + text surface cache
 
         with open(os.path.join(self.font_dir, "language.ini"), 'r', encoding="UTF-8") as language_file:
             language_lists = language_file.read().split('\n')
@@ -48,70 +89,122 @@ class MuseRush:
         # image
         self.image_dir = os.path.join(self.dir, "image")
         pygame.display.set_icon(pygame.image.load(os.path.join(self.image_dir, "icon.png")))    # set icon
-        self.spr_powered= pygame.image.load(os.path.join(self.image_dir, "powered.png"))
-        self.spr_logoback = pygame.image.load(os.path.join(self.image_dir, "logoback.png"))
-        self.spr_logo = pygame.image.load(os.path.join(self.image_dir, "logo.png"))
-        self.spr_enemy1 = pygame.image.load(os.path.join(self.image_dir, "enemy1.png"))
-        self.spr_enemy2 = pygame.image.load(os.path.join(self.image_dir, "enemy2.png"))
-        self.spr_enemy3 = pygame.image.load(os.path.join(self.image_dir, "enemy3.png"))
-        self.spr_playerIdle = pygame.image.load(os.path.join(self.image_dir, "playerIdle.png"))
-        self.spr_playerAttack = pygame.image.load(os.path.join(self.image_dir, "playerattack.png"))
-        self.spr_playerAttackUp = pygame.image.load(os.path.join(self.image_dir, "playerattackup.png"))
-        self.spr_playerAttackDown = pygame.image.load(os.path.join(self.image_dir, "playerattackdown.png"))
-        self.spr_target = pygame.image.load(os.path.join(self.image_dir, "target.png"))
-        self.spr_background = pygame.image.load(os.path.join(self.image_dir, "background.png"))
+        self.atlas = SpriteAtlas(self.image_dir, self.render_scale)    # decoded, converted and scaled once
+        self.spr_powered = self.atlas.load("powered", "powered.png")    # logo screen1 (needed now)
+        self.spr_background = self.atlas.load("background", "background.png")
+        self.atlas.load_async(self.asset_pool, "logoback", "logoback.png",
+                              [(600 + i, 600 + i) for i in LOGO_PULSE])   # logo pulse frames
+        self.atlas.load_async(self.asset_pool, "logo", "logo.png", [(600 + i, 300 + i) for i in LOGO_PULSE])
+
+        for i in range(3):
+            self.atlas.load_async(self.asset_pool, "enemy" + str(i + 1), "enemy" + str(i + 1) + ".png", [ENEMY_SIZE[i]])
+
+        for name, filename in [("playerIdle", "playerIdle.png"), ("playerAttack", "playerattack.png"),
+                               ("playerAttackUp", "playerattackup.png"), ("playerAttackDown", "playerattackdown.png")]:
+            self.atlas.load_async(self.asset_pool, name, filename, [PLAYER_SIZE])
+
+        self.atlas.load_async(self.asset_pool, "target", "target.png")
         self.rolling_bg = BackGround(self)
+        self.layers = LayerCache(self.screen.get_size(), LAYER_CACHE_SIZE)     # main / select / score backgrounds
 
         # sound
         self.sound_dir = os.path.join(self.dir, "sound")
         self.bg_main = os.path.join(self.sound_dir, "bg_main.wav")
-        self.sound_click = pygame.mixer.Sound(os.path.join(self.sound_dir, "click.wav"))
-        self.sound_hit = pygame.mixer.Sound(os.path.join(self.sound_dir, "hit.wav"))
-        self.sound_miss = pygame.mixer.Sound(os.path.join(self.sound_dir, "miss.wav"))
-        self.sound_damage = pygame.mixer.Sound(os.path.join(self.sound_dir, "damage.wav"))
+        self.sound_loads = dict()                               # name -> Future of the decoded Sound
+
+        for name in ["click", "hit", "miss", "damage"]:
+            sound_path = os.path.join(self.sound_dir, name + ".wav")
+            self.sound_loads[name] = self.asset_pool.submit(pygame.mixer.Sound, sound_path)
+        self.voices = VoiceManager(VOICE_CHANNELS, AUDIO_BUFFER, AUDIO_LATENCY)     # hit / miss / damage effects
+        self.song_clock = SongClock(self.voices.latency + AUDIO_OFFSET)    # play time from the music position
 
         # song
         self.song_dir = os.path.join(self.dir, "song")
-        music_type = ["ogg", "mp3", "wav"]
-        song_lists = [i for i in os.listdir(self.song_dir) if i.split('.')[-1] in music_type]
-        self.song_list = list()                                 # song name list
-        self.song_path = list()                                 # song path list
+        self.library = SongLibrary(self.song_dir, workers=1)    # index of playable songs and chart headers
+        self.library.scan_async(self.probe_song)                # probes music files: done before the bgm starts
+        self.scores = ScoreStore(os.path.join(self.dir, "scores.journal"))     # high scores (charts are read-only)
+
+    def finish_loading(self, wait=False):                       # main thread: True once assets and songs are in
+        if not wait and not (all(i.done() for i in self.sound_loads.values()) and self.library.ready.is_set()):
+            return False
+
+        if not self.atlas.ready(wait):
+            return False
+
+        self.library.ready.wait()
+        self.library.check()                                    # scan errors are raised here, like decode errors
+        self.spr_logoback = self.atlas.get("logoback")
+        self.spr_logo = self.atlas.get("logo")
+        self.spr_enemy1 = self.atlas.get("enemy1")
+        self.spr_enemy2 = self.atlas.get("enemy2")
+        self.spr_enemy3 = self.atlas.get("enemy3")
+        self.spr_playerIdle = self.atlas.get("playerIdle")
+        self.spr_playerAttack = self.atlas.get("playerAttack")
+        self.spr_playerAttackUp = self.atlas.get("playerAttackUp")
+        self.spr_playerAttackDown = self.atlas.get("playerAttackDown")
+        self.spr_target = self.atlas.get("target")
+        self.sound_click = self.sound_loads["click"].result()
+        self.sound_hit = self.voices.add("hit", self.sound_loads["hit"].result())
+        self.sound_miss = self.voices.add("miss", self.sound_loads["miss"].result())
+        self.sound_damage = self.voices.add("damage", self.sound_loads["damage"].result())
+        self.load_songList()
+        self.new()
+        pygame.mixer.music.load(self.bg_main)                   # bgm
+        self.loaded = True
+        self.startup.mark("loaded")
 
-        for song in song_lists:
-            try:
-                pygame.mixer.music.load(os.path.join(self.song_dir, song))
-                self.song_list.append(song.split('.')[0])
-                self.song_path.append(os.path.join(self.song_dir, song))
-            except:
-                print("error: " + str(song) + "is unsupported format music file")
+        if STARTUP_REPORT:
+            print(self.startup.report())
 
-        self.song_num = len(self.song_list)                     # available song number
+        return True
+
+    def load_songList(self):
+        self.song_list = list()                                 # song name list
+        self.song_path = list()                                 # song path list
         self.song_dataPath = list()                             # song data file path list
         self.song_highScore = list()                            # song highscore list
         self.song_perfectScore = list()                         # song maxscore list
+        self.song_analysis = list()                             # chart analysis list (None: not analyzed)
 
-        for song in self.song_list:
-            song_dataCoord = os.path.join(self.song_dir, song + ".ini")
+        for song in self.library.songs():
+            self.song_list.append(song["name"])
+            self.song_path.append(os.path.join(self.song_dir, song["file"]))
 
-            try:
-                with open(song_dataCoord, 'r', encoding="UTF-8") as song_file:
-                    song_scoreList = song_file.read().split('\n')[0]
-
-                self.song_highScore.append(int(song_scoreList.split(':')[1]))
-                self.song_perfectScore.append(int(song_scoreList.split(':')[2]))
-                self.song_dataPath.append(song_dataCoord)
-            except:
-                print("error: " + str(song) + "'s song data file is damaged or does not exist.")
+            if song["chart"] is not None and song["chart"]["high_score"] != -1:
+                self.song_highScore.append(self.scores.get(song["name"], song["chart"]["high_score"]))
+                self.song_perfectScore.append(song["chart"]["perfect_score"])
+                self.song_dataPath.append(os.path.join(self.song_dir, song["chart"]["path"]))
+                self.song_analysis.append(song["chart"]["analysis"])
+            else:
+                print("error: " + str(song["name"]) + "'s song data file is damaged or does not exist.")
                 self.song_highScore.append(-1)
                 self.song_perfectScore.append(-1)
                 self.song_dataPath.append(-1)
+                self.song_analysis.append(None)
+
+        self.song_num = len(self.song_list)                     # available song number
+
+    def probe_song(self, path):                                 # called only for new or changed song files
+        try:
+            pygame.mixer.music.load(path)
+            return True
+        except:
+            print("error: " + os.path.basename(path) + "is unsupported format music file")
+            return False
 
     def new(self):                                              # Game Initialize
-        self.song_data = list()                                 # song data list
-        self.song_dataLength = 0                                # song data length
-        self.song_dataIndex = 0                                 # song data index
+        for enemy in self.enemys.sprites():
+            enemy.release()                                     # back to the enemy pool
+
+        self.chart = None                                       # compiled song data
+        self.sim = None                                         # chart playback / judgment core
+        self.replay = None                                      # input stream of the song being played
+        self.telemetry = None                                   # judgment timing of the song (score screen)
+        self.timing_surface = None                              # score screen offset histogram
         self.score = 0                                          # current game score
-        self.all_sprites = pygame.sprite.Group()                # sprite group
+        self.loop_a = -1                                        # practice loop (ms, -1: not set)
+        self.loop_b = -1
+        self.all_sprites = pygame.sprite.RenderUpdates()        # sprite group (draw returns changed rects)
         self.enemys = pygame.sprite.Group()
         self.player = Player(self)
 
@@ -119,17 +212,44 @@ class MuseRush:
         self.playing = True
 
         while self.playing:
-            self.clock.tick(FPS)
+            self.profiler.start()
+            self.steps = self.pacer.wait(self.input)
+            self.clock.tick()
+            self.profiler.mark("wait")
             self.events()
+            self.profiler.mark("events")
             self.update()
+            self.profiler.mark("update")
             self.draw()
-            pygame.display.flip()
+            self.profiler.mark("draw")
+
+            if self.dirty_rects is None:                        # present once per frame
+                pygame.display.flip()
+            else:
+                pygame.display.update(self.dirty_rects)
+
+            self.profiler.mark("present")
+            self.profiler.end(self.screen_mode, len(self.enemys), self.pacer.presented())
+
+            if self.profiler.count == 1:
+                self.startup.mark("first frame")
 
         pygame.mixer.music.fadeout(600)
 
+        if PROFILE_FILE != "" and not self.running:
+            self.profiler.dump(os.path.join(self.dir, PROFILE_FILE))
+
     def update(self):                                           # Game Loop - Update
-        self.all_sprites.update()                               # screen update
+        if AUDIO_SYNC and self.screen_mode == 4 and self.countdown_tick == 0 and self.screen_value[1] == 0\
+                and pygame.mixer.music.get_busy():
+            self.start_tick = self.song_clock.sync()            # drift corrected against the audio clock
+
         self.game_tick = pygame.time.get_ticks() - self.start_tick      # play time calculation
+
+        if self.sim is not None:
+            self.sim.move(self.game_tick)                       # enemy positions at the current play time
+
+        self.all_sprites.update()                               # screen update
         self.rolling_bg.update()
 
     def events(self):                                           # Game Loop - Events
@@ -137,16 +257,22 @@ class MuseRush:
         mouse_move = False                                      # mouse move boolean value
         mouse_click = 0                                         # mouse click value
         key_click = 0                                           # key value
+        key_presses = list()                                    # every key down of this frame (tick, key)
+        self.voices.new_frame()
 
-        for event in pygame.event.get():                        # Event Check
+        for event_tick, event in self.input.drain():            # Event Check
             if event.type == pygame.QUIT:                       # exit
                 if self.playing:
                     self.playing = False
                     self.running = False
             elif event.type == pygame.KEYDOWN:                  # keyboard check
                 key_click = event.key
+                key_presses.append((event_tick, event.key))
+
+                if event.key == pygame.K_F3:                    # profiler overlay
+                    self.profiler.overlay = not self.profiler.overlay
 
-                if self.screen_mode < 4:
+                if 0 < self.screen_mode < 4:
                     self.sound_click.play()
             elif event.type == pygame.MOUSEMOTION:
                 if event.rel[0] != 0 or event.rel[1] != 0:      # mouse move
@@ -154,47 +280,50 @@ class MuseRush:
             elif event.type == pygame.MOUSEBUTTONDOWN:          # mouse click
                 mouse_click = event.button
 
-                if self.screen_mode < 4:
+                if 0 < self.screen_mode < 4:
                     self.sound_click.play()
 
-        if self.screen_mode == 0:                               # Logo Screen1
-            self.screen_value[0] += ALPHA_MAX / 51
+        self.fade_rate = 0
 
-            if self.screen_value[0] == ALPHA_MAX:
+        if self.screen_mode == 0:                               # Logo Screen1 (assets and songs load meanwhile)
+            if self.screen_value[0] < ALPHA_MAX:
+                self.fade_in(0, 51)
+            elif self.loaded or self.finish_loading():
                 self.screen_value[0] = 0
                 self.screen_mode = 1
                 pygame.mixer.music.play(loops=-1)
         elif self.screen_mode == 1:                             # Logo Screen2
             if self.screen_value[3] == 0:
                 if self.screen_value[0] < ALPHA_MAX:
-                    self.screen_value[0] += ALPHA_MAX / 51
+                    self.fade_in(0, 51)
                 else:
                     if mouse_click == 1 or key_click != 0:
                         self.screen_value[3] = 1
             else:
                 if self.screen_value[0] > 0:
-                    self.screen_value[0] -= ALPHA_MAX / 15
+                    self.fade_out(0, 15)
                 else:
                     self.screen_mode = 2
                     self.screen_value[1] = 2
                     self.screen_value[2] = 0
                     self.screen_value[3] = 0
 
-            if self.screen_value[1] > -10:
-                self.screen_value[1] -= 1
-            else:
-                if self.screen_value[2] == 0:
-                    self.screen_value[1] = random.randrange(0, 10)
-                    self.screen_value[2] = random.randrange(5, 30)
+            for _ in range(self.steps):                         # logo pulse: one size per step
+                if self.screen_value[1] > -10:
+                    self.screen_value[1] -= 1
                 else:
-                    self.screen_value[2] -= 1
+                    if self.screen_value[2] == 0:
+                        self.screen_value[1] = random.randrange(0, 10)
+                        self.screen_value[2] = random.randrange(5, 30)
+                    else:
+                        self.screen_value[2] -= 1
         elif self.screen_mode == 2:                             # Main Screen
             if self.screen_value[2] == 0:
                 if self.screen_value[0] < ALPHA_MAX:
-                    self.screen_value[0] += ALPHA_MAX / 15
+                    self.fade_in(0, 15)
 
                     if self.screen_value[3] > 0:
-                        self.screen_value[3] -= ALPHA_MAX / 15
+                        self.fade_out(3, 15)
                 else:
                     for i in range(4):
                         # mouse cursor check
@@ -222,7 +351,7 @@ class MuseRush:
                             self.gameFont = os.path.join(self.font_dir, self.load_language(1))
             elif self.screen_value[2] == 1:
                 if self.screen_value[0] > 0:
-                    self.screen_value[0] -= ALPHA_MAX / 15
+                    self.fade_out(0, 15)
                 else:
                     self.screen_mode = 3
                     self.screen_value[1] = 0
@@ -238,14 +367,14 @@ class MuseRush:
                     self.screen_value[2] = 0
             elif self.screen_value[2] == 3:
                 if self.screen_value[0] > 0:
-                    self.screen_value[0] -= ALPHA_MAX / 15
+                    self.fade_out(0, 15)
                 else:
                     self.playing = False
                     self.running = False
         elif self.screen_mode == 3:                             # Song Select Screen
             if self.screen_value[2] == 0:
                 if self.screen_value[0] < ALPHA_MAX:
-                    self.screen_value[0] += ALPHA_MAX / 15
+                    self.fade_in(0, 15)
 
                 self.screen_value[1] = 0
                 songChange = False
@@ -261,6 +390,9 @@ class MuseRush:
                 elif round(0.73 * WIDTH - 75) < mouse_coord[0] < round(0.73 * WIDTH + 75)\
                         and round(HEIGHT / 2 + 85) < mouse_coord[1] < round(HEIGHT / 2 + 125):
                     self.screen_value[1] = 4
+                elif round(0.77 * WIDTH - 75) < mouse_coord[0] < round(0.77 * WIDTH + 75)\
+                        and round(HEIGHT / 2 + 145) < mouse_coord[1] < round(HEIGHT / 2 + 185):
+                    self.screen_value[1] = 5
 
                 if mouse_click == 1:                            # mouse click check
                     if self.screen_value[1] == 1:
@@ -271,12 +403,11 @@ class MuseRush:
                         if self.song_select < self.song_num:
                             self.song_select += 1
                             songChange = True
-                    elif self.screen_value[1] == 3:
+                    elif self.screen_value[1] == 3 or self.screen_value[1] == 5:
                         if self.song_highScore[self.song_select - 1] != -1:
+                            self.practice = self.screen_value[1] == 5
                             self.screen_value[2] = 1
                             pygame.mixer.music.fadeout(600)
-                            pygame.time.delay(2000)
-                            pygame.mixer.music.play()
                     elif self.screen_value[1] == 4:
                         self.screen_value[2] = 2
                 elif key_click == pygame.K_UP or mouse_click == 4:  # key check
@@ -287,12 +418,11 @@ class MuseRush:
                     if self.song_select < self.song_num:
                         self.song_select += 1
                         songChange = True
-                elif key_click == pygame.K_RIGHT or key_click == 13:
+                elif key_click == pygame.K_RIGHT or key_click == 13 or key_click == pygame.K_p:
                     if self.song_highScore[self.song_select - 1] != -1:
+                        self.practice = key_click == pygame.K_p
                         self.screen_value[2] = 1
                         pygame.mixer.music.fadeout(600)
-                        pygame.time.delay(2000)
-                        pygame.mixer.music.play()
                 elif key_click == pygame.K_LEFT:
                     self.screen_value[2] = 2
 
@@ -307,8 +437,7 @@ class MuseRush:
                     self.screen_mode = 4
                     self.screen_value[1] = 0
                     self.screen_value[2] = 0
-                    self.start_tick = pygame.time.get_ticks()
-                    self.load_songData()
+                    self.start_song()
                 else:
                     self.screen_mode = 2
                     self.screen_value[1] = 0
@@ -319,87 +448,37 @@ class MuseRush:
         elif self.screen_mode == 4:                             # Play Screen
             if self.screen_value[1] == 0:
                 if self.screen_value[0] < ALPHA_MAX:
-                    self.screen_value[0] += ALPHA_MAX / 15
+                    self.fade_in(0, 15)
 
                 self.all_sprites.add(self.player)
                 self.all_sprites.add(self.player.upper_target)
                 self.all_sprites.add(self.player.lower_target)
-                self.create_enemy()                             # create enemy
-
-                if key_click == pygame.K_s or key_click == pygame.K_d:          # key check
-                    if self.player.position_down:
-                        self.player.position_down = False
-                        self.player.position_up = True
-                        self.player.attacked = True
-                        self.player.image = self.player.image_attack_up
-                    else:
-                        if self.player.attacked:
-                            self.player.attacked = False
-                            self.player.image = self.player.image_idle
-                        else:
-                            self.player.attacked = True
-                            self.player.image = self.player.image_attack
-                    self.player.upper_attack = True
-                    self.player.rect.y = self.player.upper_y
-                    IsBlank = True
-                    for enemy in self.enemys.sprites():
-                        IsBlank = False
-                        if abs(enemy.rect.y - self.player.upper_target.rect.y) < 50:
-                            if self.player.upper_target.rect.colliderect(enemy.rect):
-                                self.score += 100
-                                enemy.kill()
-                                self.sound_hit.play()
-                            elif abs(enemy.rect.x - self.player.upper_target.rect.x) < 100:
-                                self.score += 50
-                                enemy.kill()
-                                self.sound_hit.play()
-                            else:
-                                self.sound_miss.play()
-                        else:
-                            self.sound_miss.play()
-                    if IsBlank == True:
-                        self.sound_miss.play()
-                    self.player.upper_attack = False
-                elif key_click == pygame.K_l or key_click == pygame.K_SEMICOLON:
-                    if self.player.position_up:
-                        self.player.position_down = True
-                        self.player.position_up = False
-                        self.player.attacked = True
-                        self.player.image = self.player.image_attack_down
-                    else:
-                        if self.player.attacked:
-                            self.player.attacked = False
-                            self.player.image = self.player.image_idle
-                        else:
-                            self.player.attacked = True
-                            self.player.image = self.player.image_attack
-                    self.player.lower_attack = True
-                    self.player.rect.y = self.player.lower_y
-                    IsBlank = True
-                    for enemy in self.enemys.sprites():
-                        IsBlank = False
-                        if abs(enemy.rect.y - self.player.lower_target.rect.y) < 50:
-                            if self.player.lower_target.rect.colliderect(enemy.rect):
-                                self.score += 100
-                                enemy.kill()
-                                self.sound_hit.play()
-                            elif abs(enemy.rect.x - self.player.lower_target.rect.x) < 100:
-                                self.score += 50
-                                enemy.kill()
-                                self.sound_hit.play()
-                            else:
-                                self.sound_miss.play()
-                        else:
-                            self.sound_miss.play()
-                    if IsBlank == True:
-                        self.sound_miss.play()
-                    self.player.lower_attack = False
+
+                if self.countdown_tick != 0:
+                    self.count_down()
+                else:
+                    if self.practice and 0 <= self.loop_b <= self.game_tick:
+                        self.seek(max(self.loop_a, 0))          # A-B loop
+
+                    self.create_enemy()                         # create enemy
+
+                    for event_tick, key in key_presses:        # key check
+                        if key == pygame.K_s or key == pygame.K_d:
+                            self.attack(0, event_tick - self.start_tick)
+                        elif key == pygame.K_l or key == pygame.K_SEMICOLON:
+                            self.attack(1, event_tick - self.start_tick)
+                        elif self.practice:
+                            self.practice_key(key, event_tick - self.start_tick)
+
+                    self.sim.expire(pygame.time.get_ticks() - self.start_tick)     # missed notes leave their lane
             else:
                 if self.screen_value[0] > 0:
-                    self.screen_value[0] -= ALPHA_MAX / 85
-                else:
+                    self.fade_out(0, 85)
+                elif self.hold_tick == 0:
                     pygame.mixer.music.fadeout(1200)
-                    pygame.time.delay(2000)
+                    self.hold_tick = pygame.time.get_ticks() + 2000     # score screen once the music is out
+                elif pygame.time.get_ticks() >= self.hold_tick:
+                    self.hold_tick = 0
                     pygame.mixer.music.play()
                     self.screen_mode = 5
                     self.screen_value[1] = 0
@@ -407,7 +486,7 @@ class MuseRush:
             self.all_sprites.empty()
             if self.screen_value[1] == 0:
                 if self.screen_value[0] < ALPHA_MAX:
-                    self.screen_value[0] += ALPHA_MAX / 15
+                    self.fade_in(0, 15)
 
                 if mouse_move:
                     if round(WIDTH / 2 - 160) < mouse_coord[0] < round(WIDTH / 2 - 40)\
@@ -427,7 +506,7 @@ class MuseRush:
                     self.screen_value[1] = self.screen_value[2]
             else:
                 if self.screen_value[0] > 0:
-                    self.screen_value[0] -= ALPHA_MAX / 15
+                    self.fade_out(0, 15)
                 else:
                     self.new()
 
@@ -436,55 +515,190 @@ class MuseRush:
                     else:
                         self.screen_mode = 4
                         pygame.mixer.music.fadeout(600)
-                        pygame.time.delay(2000)
-                        pygame.mixer.music.play()
-                        self.start_tick = pygame.time.get_ticks()
-                        self.load_songData()
+                        self.start_song()
 
                     self.screen_value[1] = 0
                     self.screen_value[2] = 0
 
+    def fade_in(self, index, length):                          # screen_value[index] to ALPHA_MAX in length steps
+        self.screen_value[index] = min(self.screen_value[index] + ALPHA_MAX / length * self.steps, ALPHA_MAX)
+
+        if index == 0:
+            self.fade_rate = ALPHA_MAX / length
+
+    def fade_out(self, index, length):                         # screen_value[index] to 0 in length steps
+        self.screen_value[index] = max(self.screen_value[index] - ALPHA_MAX / length * self.steps, 0)
+
+        if index == 0:
+            self.fade_rate = -ALPHA_MAX / length
+
+    def fade_alpha(self):                                       # screen_value[0] drawn between two logic steps
+        value = self.screen_value[0] + self.fade_rate * self.pacer.alpha
+        return round(min(value, ALPHA_MAX) if self.fade_rate >= 0 else max(value, 0))
+
     def draw(self):                                             # Game Loop - Draw
-        self.background = pygame.Surface((WIDTH, HEIGHT))
-        self.background.blit(self.spr_background, (0, 0))
-        self.screen.blit(self.background, (0, 0))
-        self.draw_screen()                                      # draw screen
-        self.all_sprites.draw(self.screen)
-        pygame.display.update()
+        self.text_cache.new_frame()
+
+        if DIRTY_RENDER and self.screen_mode == 4 and self.drawn_mode == 4:
+            self.dirty_rects = self.draw_dirty()                # play screen: changed regions only
+        else:
+            layer = self.static_layer()
+
+            if layer is not None:
+                self.screen.blit(layer, (0, 0))                 # background and shapes in one blit
+            elif self.screen_mode != 4 or DIRTY_RENDER:         # the rolling background covers the play screen
+                self.screen.blit(self.spr_background, (0, 0))
+
+            self.draw_screen()                                  # draw screen
+            self.all_sprites.draw(self.screen)
+            self.dirty_rects = None
+
+        if self.window is not self.screen:                      # internal resolution: one scale to the window
+            pygame.transform.scale(self.screen, self.window.get_size(), self.window)
+            self.dirty_rects = None
+
+        if self.profiler.overlay:                               # on the window: readable at any render scale
+            profile_rect = self.draw_profile()
+
+            if self.window is self.screen and self.screen_mode == 4:   # erased with the play screen HUD
+                self.hud_rects.append(profile_rect)
 
-    def draw_screen(self):                                      # Draw Screen
-        screen_alpha = self.screen_value[0]
+            if self.dirty_rects is not None:
+                self.dirty_rects.append(profile_rect)
+
+        self.drawn_mode = self.screen_mode
+
+    def static_layer(self):                                     # cached background of menu screens (None: not cached,
+                                                                # alpha by logic step: one layer per step)
+        screen_alpha = round(self.screen_value[0])
+
+        if self.screen_mode == 2:                               # logoback: sized by the menu index, fades out
+            return self.layers.get((2, self.screen_value[1], self.screen_value[2],
+                                    ALPHA_MAX if self.screen_value[2] == 0 else screen_alpha), self.compose_main)
+        elif self.screen_mode == 3:                             # rings grow with the fade in
+            return self.layers.get((3, screen_alpha), self.compose_select)
+        elif self.screen_mode == 5:
+            return self.layers.get((5,), self.compose_score)
+
+        return None
+
+    def compose_main(self, surface):
+        surface.blit(self.spr_background, (0, 0))
+        spr_logobackRescale = self.atlas.scaled("logoback", (600 + self.screen_value[1], 600 + self.screen_value[1]))
+
+        if self.screen_value[2] == 0:
+            spr_logobackRescale.set_alpha(ALPHA_MAX)
+            surface.blit(spr_logobackRescale, (0, 0))
+        else:
+            screen_alpha = round(self.screen_value[0])
+            spr_logobackRescale.set_alpha(screen_alpha)
+            logoback_coord = 0 if self.screen_value[2] == 2 else self.px((screen_alpha - ALPHA_MAX) / 10)
+            surface.blit(spr_logobackRescale, (logoback_coord, 0))
+
+        if self.screen_value[2] == 2:
+            surface.fill(WHITE, pygame.Rect(self.px(30), self.px(30), self.px(WIDTH - 60), self.px(HEIGHT - 60)))
+
+    def compose_select(self, surface):
+        screen_alpha = round(self.screen_value[0])
+        surface.blit(self.spr_background, (0, 0))
+        circle_coord = (self.px(WIDTH * 1.2), self.px(HEIGHT / 2))
+        pygame.draw.circle(surface, WHITE, circle_coord, self.px(0.95 * WIDTH + screen_alpha), 1)
+        pygame.draw.circle(surface, WHITE, circle_coord, self.px(0.50 * WIDTH + screen_alpha), 1)
+        pygame.draw.circle(surface, WHITE, circle_coord, self.px(0.15 * WIDTH + screen_alpha), 1)
+        pygame.draw.circle(surface, RED, circle_coord, self.px(0.125 * WIDTH + screen_alpha), 1)
+        pygame.draw.circle(surface, BLUE, circle_coord, self.px(0.1 * WIDTH + screen_alpha), 1)
+
+    def compose_score(self, surface):
+        surface.blit(self.spr_background, (0, 0))
+        circle_coord = (self.px(WIDTH / 2), self.px(HEIGHT / 2))
+        pygame.draw.circle(surface, BLUE, circle_coord, self.px(HEIGHT / 2 - 30), 1)
+        pygame.draw.circle(surface, WHITE, circle_coord, self.px(HEIGHT / 2), 1)
+        pygame.draw.circle(surface, RED, circle_coord, self.px(HEIGHT / 2 + 30), 1)
+
+    def draw_dirty(self):                                       # Draw Play Screen (dirty rectangles)
+        self.all_sprites.clear(self.screen, self.spr_background)
+        dirty_rects = list()
+
+        for rect in self.hud_rects:                             # erase the last HUD text
+            self.screen.blit(self.spr_background, rect, rect)
+
+        dirty_rects += self.hud_rects
+        self.hud_rects = self.draw_hud(round(self.screen_value[0]))     # text alpha by logic step: cached
+        dirty_rects += self.hud_rects
+        dirty_rects += self.all_sprites.draw(self.screen)
+        return dirty_rects
+
+    def draw_profile(self):                                     # profiler overlay (p50 / p95 / p99 ms)
+        if self.profile_surface is None or self.profiler.count % 30 == 0:
+            font = self.text_cache.get_font(os.path.join(self.font_dir, DEFAULT_FONT), 16)
+            lines = ["%-8s %6.2f %6.2f %6.2f" % tuple([stage] + self.profiler.percentiles(stage)) for stage in STAGES]
+            lines.append("%-8s %6.2f %6.2f %6.2f" % tuple(["frame"] + self.profiler.percentiles()))
+            lines.append("fps %.1f  enemies %d  missed %d" % (self.clock.get_fps(), len(self.enemys),
+                                                              self.profiler.missed()))
+            lines.append("audio %.1f ms  skew %.1f ms  voices %d" % (self.song_clock.latency, self.song_clock.skew,
+                                                                       self.voices.busy()))
+            line_surfaces = [font.render(line, True, WHITE) for line in lines]
+            self.profile_surface = pygame.Surface((max(i.get_width() for i in line_surfaces) + 16,
+                                                   sum(i.get_height() for i in line_surfaces) + 16))
+            self.profile_surface.fill((0, 0, 0))
+
+            for i, line_surface in enumerate(line_surfaces):
+                self.profile_surface.blit(line_surface, (8, 8 + i * line_surface.get_height()))
+
+            self.profile_surface.set_alpha(200)
+
+        return self.window.blit(self.profile_surface, (10, 50))
+
+    def draw_hud(self, screen_alpha):                           # play time and score (and the countdown)
+        game_tick = max(self.game_tick, 0)
+        time_m = game_tick // 60000
+        time_s = str(round(game_tick / 1000) - time_m * 60)
+
+        if len(time_s) == 1:
+            time_s = "0" + time_s
+
+        time_str = str(time_m) + " : " + time_s
+        score_str = self.load_language(13) + " : " + str(self.score)
+        hud_rects = [self.draw_text(time_str, 24, WHITE, 10 + len(time_str) * 6, 15, screen_alpha),
+                     self.draw_text(score_str, 24, WHITE, WIDTH - 20 - len(score_str) * 6, 15, screen_alpha)]
+        remain = self.countdown_tick - pygame.time.get_ticks()
+
+        if self.practice:                                       # loop points
+            practice_str = self.load_language(18)
+
+            if self.loop_a >= 0:
+                practice_str += "  A " + format_time(self.loop_a)
+
+            if self.loop_b >= 0:
+                practice_str += "  B " + format_time(self.loop_b)
+
+            hud_rects.append(self.draw_text(practice_str, 24, WHITE, WIDTH / 2, 15, screen_alpha))
+
+        if self.countdown_tick != 0 and remain > 0:             # shrinks every second: 160 -> 100
+            hud_rects.append(self.draw_text(str(remain // 1000 + 1), 100 + remain % 1000 // 150 * 10, WHITE,
+                                            WIDTH / 2, HEIGHT / 2 - 120))
+
+        return hud_rects
+
+    def draw_screen(self):                                      # Draw Screen (logo sprites fade between steps,
+                                                                # text by logic step: one text cache entry per step)
+        screen_alpha = self.fade_alpha() if self.screen_mode < 2 else round(self.screen_value[0])
 
         if self.screen_mode == 0:                               # logo screen1
-            screen_alpha = ALPHA_MAX - min(max(self.screen_value[0], 0), ALPHA_MAX)
+            screen_alpha = ALPHA_MAX - min(max(screen_alpha, 0), ALPHA_MAX)
             self.draw_sprite((WIDTH / 5 - 50, HEIGHT / 2 - 70), self.spr_powered, screen_alpha)
         elif self.screen_mode == 1:                             # logo screen2
-            spr_logobackRescale = pygame.transform.scale(self.spr_logoback,
-                                                         (600 + self.screen_value[1], 600 + self.screen_value[1]))
-            spr_logobackRescale.set_alpha(screen_alpha) if self.screen_value[3] == 0\
-                                                        else self.spr_logoback.set_alpha(ALPHA_MAX)
+            spr_logobackRescale = self.atlas.scaled("logoback",
+                                                    (600 + self.screen_value[1], 600 + self.screen_value[1]))
+            spr_logobackRescale.set_alpha(screen_alpha if self.screen_value[3] == 0 else ALPHA_MAX)
             self.screen.blit(spr_logobackRescale, (0, 0))
-            spr_logoRescale = pygame.transform.scale(self.spr_logo,
-                                                     (600 + self.screen_value[1], 300 + self.screen_value[1]))
+            spr_logoRescale = self.atlas.scaled("logo", (600 + self.screen_value[1], 300 + self.screen_value[1]))
             self.draw_sprite(((WIDTH - self.screen_value[1]) / 2, (HEIGHT / 3 - 80) - self.screen_value[1] / 2),
                              spr_logoRescale, screen_alpha)
         elif self.screen_mode == 2:                             # main screen
             select_index = [True if self.screen_value[1] == i + 1 else False for i in range(4)]
 
-            spr_logobackRescale = pygame.transform.scale(self.spr_logoback,
-                                                         (600 + self.screen_value[1], 600 + self.screen_value[1]))
-            if self.screen_value[2] == 0:
-                self.draw_sprite((0, 0), spr_logobackRescale, ALPHA_MAX)
-            else:
-                spr_logobackRescale.set_alpha(screen_alpha)
-                logoback_coord = 0 if self.screen_value[2] == 2 else round((screen_alpha - ALPHA_MAX) / 10)
-                self.screen.blit(spr_logobackRescale, (logoback_coord, 0))
-
-            if self.screen_value[2] == 2:
-                help_surface = pygame.Surface((WIDTH - 60, HEIGHT - 60))
-                help_surface.fill(WHITE)
-                help_surface.set_alpha(255)
-                self.screen.blit(help_surface, pygame.Rect(30, 30, 0, 0))
+            if self.screen_value[2] == 2:                       # logoback and help panel: static_layer
                 self.draw_text("- " + self.load_language(5) + " -", 72, BLACK, WIDTH / 2, HEIGHT / 4, 255)
                 self.draw_text(self.load_language(9), 32, BLACK, WIDTH / 2, HEIGHT / 3 + 100)
                 self.draw_text(self.load_language(10), 32, BLACK, WIDTH / 2, HEIGHT / 3 + 170)
@@ -494,17 +708,7 @@ class MuseRush:
                 self.draw_text(self.load_language(3), 72, WHITE, WIDTH / 4 * 3, 250, screen_alpha, select_index[1])
                 self.draw_text(self.load_language(4), 72, WHITE, WIDTH / 4 * 3, 350, screen_alpha, select_index[2])
                 self.draw_text(self.load_language(0), 48, WHITE, WIDTH / 4 * 3, 450, screen_alpha, select_index[3])
-        elif self.screen_mode == 3:                             # song select screen
-            surface = pygame.Surface((WIDTH, HEIGHT))
-            surface.blit(self.spr_background, (0, 0))
-            circle_coord = (round(WIDTH * 1.2), round(HEIGHT / 2))
-            pygame.draw.circle(surface, WHITE, circle_coord, round(0.95 * WIDTH + screen_alpha), 1)
-            pygame.draw.circle(surface, WHITE, circle_coord, round(0.50 * WIDTH + screen_alpha), 1)
-            pygame.draw.circle(surface, WHITE, circle_coord, round(0.15 * WIDTH + screen_alpha), 1)
-            pygame.draw.circle(surface, RED, circle_coord, round(0.125 * WIDTH + screen_alpha), 1)
-            pygame.draw.circle(surface, BLUE, circle_coord, round(0.1 * WIDTH + screen_alpha), 1)
-            self.screen.blit(surface, (0, 0))
-
+        elif self.screen_mode == 3:                             # song select screen (rings: static_layer)
             if self.song_select > 2:
                 self.draw_text(self.song_list[self.song_select - 3], 32, WHITE, 0.29 * WIDTH, 0.25 * HEIGHT - 20,
                                max(screen_alpha - 220, 0))
@@ -526,7 +730,7 @@ class MuseRush:
 
             button_songUpScale = 36 if self.screen_value[1] == 1 else 32
             button_songDownScale = 36 if self.screen_value[1] == 2 else 32
-            select_index = [True if self.screen_value[1] == i + 3 else False for i in range(2)]
+            select_index = [True if self.screen_value[1] == i + 3 else False for i in range(3)]
             self.draw_text("UP", button_songUpScale, WHITE, 0.31 * WIDTH, 0.125 * HEIGHT - 20, screen_alpha)
             self.draw_text("DOWN", button_songDownScale, WHITE, 0.31 * WIDTH, 0.875 * HEIGHT - 30, screen_alpha)
 
@@ -534,164 +738,322 @@ class MuseRush:
                 self.draw_text(self.load_language(12), 32, RED, 0.71 * WIDTH, HEIGHT / 2 - 100, screen_alpha)
             else:
                 if self.song_highScore[self.song_select - 1] >= self.song_perfectScore[self.song_select - 1]:
-                    try:
-                        font = pygame.font.Font(self.gameFont, 36)
-                    except:
-                        font = pygame.font.Font(os.path.join(self.font_dir, DEFAULT_FONT), 36)
-
-                    font.set_bold(True)
-                    cleartext_surface = font.render(self.load_language(14), False, BLUE)
-                    rotated_surface = pygame.transform.rotate(cleartext_surface, 25)
-                    rotated_surface.set_alpha(max(screen_alpha - 180, 0))
+                    rotated_surface = self.text_cache.render(self.load_language(14), self.px(36), BLUE, self.gameFont,
+                                                             bold=True, antialias=False, rot=25,
+                                                             alpha=max(screen_alpha - 180, 0))
                     cleartext_rect = rotated_surface.get_rect()
-                    cleartext_rect.midtop = (round(0.71 * WIDTH), round(HEIGHT / 2 - 150))
+                    cleartext_rect.midtop = (self.px(0.71 * WIDTH), self.px(HEIGHT / 2 - 150))
                     self.screen.blit(rotated_surface, cleartext_rect)
 
                 self.draw_text(self.load_language(8), 28, WHITE, 0.69 * WIDTH, HEIGHT / 2 - 130, screen_alpha)
                 self.draw_text(str(self.song_highScore[self.song_select - 1]), 28, WHITE, 0.69 * WIDTH, HEIGHT / 2 - 70,
                                screen_alpha)
+                analysis = self.song_analysis[self.song_select - 1]
+
+                if analysis is not None:                        # cached by the song library (chart_analyzer)
+                    self.draw_text("Lv %.1f  %.1f nps  peak %d" % (analysis["difficulty"], analysis["nps_mean"],
+                                                                   analysis["peak_on_screen"]), 20, WHITE,
+                                   0.69 * WIDTH, HEIGHT / 2 - 30, screen_alpha)    # peak: enemies on screen at once
+
+                    if analysis["malformed"] > 0:
+                        self.draw_text(str(analysis["malformed"]) + " lines skipped", 20, RED, 0.69 * WIDTH,
+                                       HEIGHT / 2 - 5, screen_alpha)
                 self.draw_text(self.load_language(7), 32, WHITE, 0.69 * WIDTH, HEIGHT / 2 + 25, screen_alpha,
                                select_index[0])
+                self.draw_text(self.load_language(18), 32, WHITE, 0.77 * WIDTH, HEIGHT / 2 + 145, screen_alpha,
+                               select_index[2])
 
             self.draw_text(self.load_language(6), 32, WHITE, 0.73 * WIDTH, HEIGHT / 2 + 85, screen_alpha,
                            select_index[1])
         elif self.screen_mode == 4:                         # play screen
-            surface = pygame.Surface((WIDTH, HEIGHT))
-            surface.blit(self.rolling_bg.image_background, (self.rolling_bg.x1, self.rolling_bg.y1))
-            surface.blit(self.rolling_bg.image_background, (self.rolling_bg.x2, self.rolling_bg.y2))
-            self.screen.blit(surface, (0, 0))
-            time_m = self.game_tick // 60000
-            time_s = str(round(self.game_tick / 1000) - time_m * 60)
-
-            if len(time_s) == 1:
-                time_s = "0" + time_s
-
-            time_str = str(time_m) + " : " + time_s
-            score_str = self.load_language(13) + " : " + str(self.score)
-            self.draw_text(time_str, 24, WHITE, 10 + len(time_str) * 6, 15, screen_alpha)
-            self.draw_text(score_str, 24, WHITE, WIDTH - 20 - len(score_str) * 6, 15, screen_alpha)
-        else:                                               # score screen
-            surface = pygame.Surface((WIDTH, HEIGHT))
-            surface.blit(self.spr_background, (0, 0))
-            circle_coord = (round(WIDTH / 2), round(HEIGHT / 2))
-            pygame.draw.circle(surface, BLUE, circle_coord, round(HEIGHT / 2 - 30), 1)
-            pygame.draw.circle(surface, WHITE, circle_coord, round(HEIGHT / 2), 1)
-            pygame.draw.circle(surface, RED, circle_coord, round(HEIGHT / 2 + 30), 1)
-            self.screen.blit(surface, (0, 0))
+            if not DIRTY_RENDER:                                # dirty mode keeps the background still
+                self.screen.blit(self.rolling_bg.image_background, (self.rolling_bg.x1, self.rolling_bg.y1))
+                self.screen.blit(self.rolling_bg.image_background, (self.rolling_bg.x2, self.rolling_bg.y2))
+
+            self.hud_rects = self.draw_hud(screen_alpha)
+        else:                                               # score screen (rings: static_layer)
             self.draw_text(self.load_language(15) + " : " + str(self.song_perfectScore[self.song_select - 1]), 32,
                            WHITE, WIDTH / 2, HEIGHT / 2 - 65, screen_alpha)
             self.draw_text(self.load_language(13) + " : " + str(self.score), 32, WHITE, WIDTH / 2, HEIGHT / 2 - 5,
                            screen_alpha)
+
+            if self.telemetry is not None and self.telemetry.count > 0:
+                self.draw_timing(screen_alpha)
+
             select_index = [True if self.screen_value[2] == i + 1 else False for i in range(2)]
             self.draw_text(self.load_language(17), 24, WHITE, WIDTH / 2 - 100, HEIGHT / 2 + 125, ALPHA_MAX,
                            select_index[0])
             self.draw_text(self.load_language(16), 24, WHITE, WIDTH / 2 + 100, HEIGHT / 2 + 125, ALPHA_MAX,
                            select_index[1])
 
+    def draw_timing(self, screen_alpha):                        # score screen: offset histogram, mean / sd, misses
+        telemetry = self.telemetry
+
+        if self.timing_surface is None:                         # bars: perfect blue, good white, miss red
+            histogram = telemetry.histogram
+            peak = max(max(histogram), 1)
+            self.timing_surface = pygame.Surface((len(histogram) * 12, 50), pygame.SRCALPHA)
+
+            for i, count in enumerate(histogram):
+                offset = abs(i * HISTOGRAM_BIN - MISS_WINDOW + HISTOGRAM_BIN / 2)
+                color = BLUE if offset <= PERFECT_WINDOW else WHITE if offset <= GOOD_WINDOW else RED
+                height = round(count * 48 / peak)
+                self.timing_surface.fill(color, pygame.Rect(i * 12 + 1, 50 - height, 10, height))
+
+            self.timing_surface.fill(WHITE, pygame.Rect(0, 49, self.timing_surface.get_width(), 1))
+
+            if self.render_scale != 1:
+                self.timing_surface = pygame.transform.smoothscale(self.timing_surface,
+                                                                   self.atlas.pixels(self.timing_surface.get_size()))
+
+        self.timing_surface.set_alpha(screen_alpha)
+        self.screen.blit(self.timing_surface, (self.px(WIDTH / 2) - self.timing_surface.get_width() // 2,
+                                               self.px(HEIGHT / 2 + 35)))
+        self.draw_text("%+.1f ms  sd %.1f ms  miss %d/%d  %d/%d" % (telemetry.mean(), telemetry.stddev(),
+                                                                   telemetry.missed[0], telemetry.judged[0],
+                                                                   telemetry.missed[1], telemetry.judged[1]),
+                       20, WHITE, WIDTH / 2, HEIGHT / 2 + 90, screen_alpha)     # per lane: upper, lower
+
     def load_language(self, index):
         try:
             return self.language_list[self.language_mode][index]
         except:
             return "Font Error"
 
-    def load_songData(self):
-        with open(self.song_dataPath[self.song_select - 1], 'r', encoding="UTF-8") as data_file:
-            data_fileLists = data_file.read().split('\n')
-
-        for data_line in data_fileLists:
-            if data_line != '' and data_line[0] != 's':
-                data_fileList = data_line.split(" - ")
-                time_list = data_fileList[0].split(':')
-                enemy_list = data_fileList[1].split(", ")
-                current_songData = list()
-                current_songData.append(int(time_list[0]) * 60000 + int(time_list[1]) * 1000 + int(time_list[2]) * 10)
-
-                for enemy in enemy_list:
-                    if enemy[0] == 'E':
-                        enemy_type = -1
-                    elif enemy[0] == '1':
-                        enemy_type = 1
-                    elif enemy[0] == '2':
-                        enemy_type = 2
-                    else:           # 3
-                        enemy_type = 3
-
-                    if enemy_type != -1:
-                        if enemy[1] == 'U':
-                            enemy_line = 0
-                        else:           # L
-                            enemy_line = 270
-
-                        enemy_data = (enemy_type, enemy_line, int(enemy[2]))
-                        current_songData.append(enemy_data)
-                    else:
-                        enemy_data = -1
-                        current_songData.append(enemy_data)
+    def start_song(self):                                       # countdown, the chart and the song load meanwhile
+        self.chart = None
+        self.sim = None
+        self.loader = self.loader_pool.submit(preload_song, self.song_dataPath[self.song_select - 1],
+                                              self.song_path[self.song_select - 1], self.practice)
+        self.countdown_tick = pygame.time.get_ticks() + COUNTDOWN
+        self.start_tick = self.countdown_tick                   # play time counts up from the countdown end
+
+    def count_down(self):
+        try:
+            if self.sim is None and self.loader.done():
+                self.load_songData()                            # simulation and enemy sprites before the first note
+
+            if self.sim is not None and pygame.time.get_ticks() >= self.countdown_tick:
+                if self.practice:                               # decoded song: exact seeks
+                    pygame.mixer.music.load(self.song_buffer.source, "wav")
+                else:
+                    pygame.mixer.music.load(self.song_buffer, self.song_path[self.song_select - 1].split('.')[-1])
+
+                self.play_song()
+                self.countdown_tick = 0
+        except:
+            print("error: " + os.path.basename(self.song_path[self.song_select - 1]) + " could not be loaded")
+            self.load_failed()
+
+    def load_failed(self):                                      # chart / song unreadable: back to the song select
+        self.loader = None
+        self.song_buffer = None
+        self.countdown_tick = 0
+        pygame.mixer.music.stop()
+        self.new()
+        self.screen_mode = 3
+        self.screen_value = [0, 0, 0, 0]
+
+    def play_song(self, song_time=0):
+        pygame.mixer.music.play(start=song_time / 1000)
+        self.start_tick = self.song_clock.start(song_time)      # play time of the audible music
+
+    def seek(self, song_time):                                  # practice: music and chart jump to song_time
+        for enemy in self.enemys.sprites():
+            enemy.release()
+
+        self.play_song(min(max(song_time, 0), self.practice_length()))
+        self.game_tick = pygame.time.get_ticks() - self.start_tick
+        self.spawn_enemies(self.sim.seek(self.game_tick))       # chart cursor: binary search
+
+    def practice_length(self):                                  # seek range (ms): to the END line or the song end
+        return self.chart.end_time if self.chart.end_time != END else self.song_buffer.duration
+
+    def practice_key(self, key, song_time):                     # left / right: seek, 0 - 9: tenth of the song
+        if key == pygame.K_LEFT:
+            self.seek(song_time - PRACTICE_SEEK)
+        elif key == pygame.K_RIGHT:
+            self.seek(song_time + PRACTICE_SEEK)
+        elif pygame.K_0 <= key <= pygame.K_9:
+            self.seek(self.practice_length() * (key - pygame.K_0) // 10)
+        elif key == pygame.K_a:                                 # loop start (a later B is kept)
+            self.loop_a = max(song_time, 0)
+
+            if self.loop_b <= self.loop_a:
+                self.loop_b = -1
+        elif key == pygame.K_b and song_time > max(self.loop_a, 0):     # loop end: back to A
+            self.loop_b = song_time
+            self.seek(max(self.loop_a, 0))
+        elif key == pygame.K_BACKSPACE:
+            self.loop_a = -1
+            self.loop_b = -1
+        elif key == pygame.K_ESCAPE:                            # to the score screen
+            self.screen_value[1] = 1
+
+    def load_songData(self):                                    # waits for the preload (no countdown: starts it)
+        if self.loader is None:
+            self.loader = self.loader_pool.submit(preload_song, self.song_dataPath[self.song_select - 1],
+                                                  self.song_path[self.song_select - 1], self.practice)
+
+        self.chart, malformed, self.song_buffer = self.loader.result()
+        self.loader = None
+        self.replay = Replay(self.chart.digest, self.atlas.size("target"), self.song_list[self.song_select - 1])\
+            if REPLAY_DIR != "" and not self.practice else None  # seeks are not replayed
+        self.telemetry = Telemetry(TELEMETRY_SIZE, self.song_list[self.song_select - 1])
+        self.timing_surface = None
+        self.sim = Simulation(self.chart, self.atlas.size("target"), replay=self.replay, telemetry=self.telemetry)
+
+        while len(self.enemy_pool) < self.chart.peak_notes:    # sized from the chart's peak concurrency
+            self.enemy_pool.append(Enemy(self))
+
+        for line_num, data_line, message in malformed:
+            print("error: " + self.song_list[self.song_select - 1] + " line " + str(line_num) + " is skipped ("
+                  + message + ")")
+
+    def attack(self, lane, press_time):                         # player attack (0: upper, 1: lower)
+        if lane == 0:
+            if self.player.position_down:
+                self.player.position_down = False
+                self.player.position_up = True
+                self.player.attacked = True
+                self.player.image = self.player.image_attack_up
+            else:
+                if self.player.attacked:
+                    self.player.attacked = False
+                    self.player.image = self.player.image_idle
+                else:
+                    self.player.attacked = True
+                    self.player.image = self.player.image_attack
+            self.player.upper_attack = True
+            self.player.rect.y = self.player.upper_y
+            self.judge(0, press_time)
+            self.player.upper_attack = False
+        else:
+            if self.player.position_up:
+                self.player.position_down = True
+                self.player.position_up = False
+                self.player.attacked = True
+                self.player.image = self.player.image_attack_down
+            else:
+                if self.player.attacked:
+                    self.player.attacked = False
+                    self.player.image = self.player.image_idle
+                else:
+                    self.player.attacked = True
+                    self.player.image = self.player.image_attack
+            self.player.lower_attack = True
+            self.player.rect.y = self.player.lower_y
+            self.judge(1, press_time)
+            self.player.lower_attack = False
+
+    def judge(self, lane, press_time):                          # hit judgment (0: upper, 1: lower)
+        judgment, note, offset = self.sim.press(lane, press_time)
+
+        if judgment == MISS:
+            self.voices.play("miss")
+        else:
+            self.voices.play("hit")
 
-                self.song_data.append(current_songData)
+        self.score = self.sim.score
 
     def create_enemy(self):
-        if self.game_tick >= self.song_data[self.song_dataIndex][0]:
-            if self.song_data[self.song_dataIndex][1] != -1:
-                enemy_num = len(self.song_data[self.song_dataIndex]) - 1
+        self.spawn_enemies(self.sim.spawn(self.game_tick))
 
-                for enemy in range(enemy_num):
-                    enemy_data = self.song_data[self.song_dataIndex][enemy + 1]
+        if self.sim.finished:
+            if self.score >= self.song_highScore[self.song_select - 1] and not self.practice:
+                self.scores.submit(self.song_list[self.song_select - 1], self.score)    # saved by a writer thread
+                self.song_highScore[self.song_select - 1] = self.score
 
-                    obj_enemy = Enemy(self, enemy_data[0], enemy_data[1], enemy_data[2])
-                    self.all_sprites.add(obj_enemy)
-                    self.enemys.add(obj_enemy)
+            if self.replay is not None:
+                self.save_replay()
 
-                self.song_dataIndex += 1
-            else:
-                if self.score >= self.song_highScore[self.song_select - 1]:
-                    with open(self.song_dataPath[self.song_select - 1], 'r', encoding="UTF-8") as file:
-                        file_lists = file.read().split('\n')
+            if SKEW_LOG != "":                                  # written by a thread, the copy keeps this song's log
+                threading.Thread(target=self.write_skew,
+                                 args=(copy.copy(self.song_clock), os.path.join(self.dir, SKEW_LOG))).start()
+
+            if TELEMETRY_FILE != "":                            # written by a thread, the telemetry is not reused
+                threading.Thread(target=self.write_telemetry,
+                                 args=(self.telemetry, os.path.join(self.dir, TELEMETRY_FILE))).start()
 
-                    file_list = "score:" + str(self.score) + ':'\
-                                + str(self.song_perfectScore[self.song_select - 1]) + '\n'
+            self.screen_value[1] = 1
 
-                    for enemy_file in file_lists:
-                        if enemy_file != '' and enemy_file[0] != 's':
-                            file_list += '\n' + enemy_file
+    def spawn_enemies(self, notes):
+        for note in notes:
+            obj_enemy = self.enemy_pool.pop() if self.enemy_pool else Enemy(self)
+            obj_enemy.spawn(note)
+            self.all_sprites.add(obj_enemy)
+            self.enemys.add(obj_enemy)
 
-                    with open(self.song_dataPath[self.song_select - 1], "w+", encoding="UTF-8") as song_file:
-                        song_file.write(file_list)
+    def save_replay(self):                                      # written by a thread, off the render loop
+        replay_dir = os.path.join(self.dir, REPLAY_DIR)
+        self.replay.score = self.score
 
-                    self.song_highScore[self.song_select - 1] = self.score
+        try:
+            os.makedirs(replay_dir, exist_ok=True)
+        except OSError as e:
+            print("error: replay is not saved (" + str(e) + ")")
+            return
 
-                self.screen_value[1] = 1
+        path = os.path.join(replay_dir, replay_name(self.replay.song))
+        threading.Thread(target=self.write_replay, args=(self.replay, path)).start()
+        self.replay = None
 
-    def draw_sprite(self, coord, spr, alpha=ALPHA_MAX, rot=0):
+    def write_replay(self, replay, path):
+        try:
+            replay.save(path)
+        except OSError as e:
+            print("error: replay is not saved (" + str(e) + ")")
+
+    def write_telemetry(self, telemetry, path):
+        try:
+            telemetry.dump(path)
+        except OSError as e:
+            print("error: telemetry is not saved (" + str(e) + ")")
+
+    def write_skew(self, song_clock, path):
+        try:
+            song_clock.dump(path)
+        except OSError as e:
+            print("error: skew log is not saved (" + str(e) + ")")
+
+    def px(self, value):                                        # layout units -> render pixels
+        return round(value * self.render_scale)
+
+    def draw_sprite(self, coord, spr, alpha=ALPHA_MAX, rot=0):  # coord in layout units, spr at the render scale
         if rot == 0:
             spr.set_alpha(alpha)
-            self.screen.blit(spr, (round(coord[0]), round(coord[1])))
+            self.screen.blit(spr, (self.px(coord[0]), self.px(coord[1])))
         else:
             rotated_spr = pygame.transform.rotate(spr, rot)
             rotated_spr.set_alpha(alpha)
-            self.screen.blit(rotated_spr, (round(coord[0] + spr.get_width() / 2 - rotated_spr.get_width() / 2),
-                                           round(coord[1] + spr.get_height() / 2 - rotated_spr.get_height() / 2)))
-
-    def draw_text(self, text, size, color, x, y, alpha=ALPHA_MAX, boldunderline=False):
-        try:
-            font = pygame.font.Font(self.gameFont, size)
-        except:
-            font = pygame.font.Font(os.path.join(self.font_dir, DEFAULT_FONT), size)
+            self.screen.blit(rotated_spr, (self.px(coord[0]) + (spr.get_width() - rotated_spr.get_width()) // 2,
+                                           self.px(coord[1]) + (spr.get_height() - rotated_spr.get_height()) // 2))
 
-        font.set_underline(boldunderline)
-        font.set_bold(boldunderline)
-        text_surface = font.render(text, True, color)
+    def draw_text(self, text, size, color, x, y, alpha=ALPHA_MAX, boldunderline=False):     # size, x, y: layout units
+        size = max(self.px(size), 1)
+        text_surface = self.text_cache.render(text, size, color, self.gameFont, boldunderline, boldunderline)
         text_rect = text_surface.get_rect()
-        text_rect.midtop = (round(x), round(y))
+        text_rect.midtop = (self.px(x), self.px(y))
 
-        if alpha == ALPHA_MAX:
-            self.screen.blit(text_surface, text_rect)
-        else:
-            surface = pygame.Surface((len(text) * size, size + 20))
-            surface.fill((0, 0, 0))
-            surface.blit(text_surface, pygame.Rect(0, 0, 10, 10))
-            surface.set_alpha(alpha)
-            self.screen.blit(surface, text_rect)
+        if alpha != ALPHA_MAX:
+            text_surface = self.text_cache.render(text, size, color, self.gameFont, boldunderline, boldunderline,
+                                                  alpha=alpha)
+
+        return self.screen.blit(text_surface, text_rect)
+
+
+def preload_song(chart_path, song_path, practice=False):        # worker: (chart, malformed lines, song file)
+    malformed = list()
+    chart = load_compiled(chart_path, malformed)
+    chart.digest                                                # hashed here, not on the first frame
+
+    if practice:                                                # decoded pcm (cached next to the song)
+        return chart, malformed, load_pcm(song_path)
+
+    with open(song_path, 'rb') as song_file:
+        song_buffer = io.BytesIO(song_file.read())
+
+    return chart, malformed, song_buffer
 
 
 class TargetPoint(pygame.sprite.Sprite):
@@ -701,18 +1063,19 @@ class TargetPoint(pygame.sprite.Sprite):
         self.line = line
 
         if self.line == 0:
-            self.image = self.game.spr_target
+            self.image = self.game.atlas.get("target")
         else:
-            self.image = self.game.spr_target
+            self.image = self.game.atlas.get("target")
 
-        self.touch_coord = (round(self.image.get_width() / 2), round(self.image.get_height() / 2))
+        target_size = self.game.atlas.size("target")            # layout units (the simulation's hit geometry)
+        self.touch_coord = (round(target_size[0] / 2), round(target_size[1] / 2))
         self.rect = self.image.get_rect()
-        self.rect.x = WIDTH / 8 + self.touch_coord[0] + 100
+        self.rect.x = game.px(WIDTH / 8 + self.touch_coord[0] + 100)
 
         if self.line == 0:
-            self.rect.y = HEIGHT / 4 + self.touch_coord[1]
+            self.rect.y = game.px(HEIGHT / 4 + self.touch_coord[1])
         else:
-            self.rect.y = HEIGHT / 2 + self.touch_coord[1] + 40
+            self.rect.y = game.px(HEIGHT / 2 + self.touch_coord[1] + 40)
 
 
 class Player(pygame.sprite.Sprite):
@@ -727,73 +1090,65 @@ class Player(pygame.sprite.Sprite):
         self.position_down = True
         self.attacked = False
 
-        self.image_idle = pygame.transform.scale(self.game.spr_playerIdle, (180, 180))
-        self.image_attack = pygame.transform.scale(self.game.spr_playerAttack, (180, 180))
-        self.image_attack_up = pygame.transform.scale(self.game.spr_playerAttackUp, (180, 180))
-        self.image_attack_down = pygame.transform.scale(self.game.spr_playerAttackDown, (180, 180))
+        self.image_idle = self.game.atlas.scaled("playerIdle", PLAYER_SIZE)
+        self.image_attack = self.game.atlas.scaled("playerAttack", PLAYER_SIZE)
+        self.image_attack_up = self.game.atlas.scaled("playerAttackUp", PLAYER_SIZE)
+        self.image_attack_down = self.game.atlas.scaled("playerAttackDown", PLAYER_SIZE)
 
         self.image = self.image_idle
 
-        self.touch_coord = (round(self.image.get_width() / 2), round(self.image.get_height() / 2))
+        self.touch_coord = (round(PLAYER_SIZE[0] / 2), round(PLAYER_SIZE[1] / 2))    # layout units
         self.rect = self.image.get_rect()
-        self.rect.x = WIDTH / 8
-        self.rect.y = HEIGHT / 2
-
-        self.rect.x += self.touch_coord[0] - 75
-        self.rect.y += self.touch_coord[1] - 30
+        self.rect.x = game.px(int(WIDTH / 8) + self.touch_coord[0] - 75)
+        self.rect.y = game.px(int(HEIGHT / 2) + self.touch_coord[1] - 30)
 
         self.upper_target = TargetPoint(game, 0)
         self.lower_target = TargetPoint(game, 1)
 
-        self.upper_y = HEIGHT / 4 + 20
+        self.upper_y = game.px(HEIGHT / 4 + 20)                 # render pixels
         self.lower_y = self.rect.y
 
         self.game.player = self
 
 
-class Enemy(pygame.sprite.Sprite):                          # Enemy Class
-    def __init__(self, game, type, line, speed):
+class Enemy(pygame.sprite.Sprite):                          # Enemy Class (view of a simulation note, pooled)
+    def __init__(self, game):
         pygame.sprite.Sprite.__init__(self)
         self.game = game
-        self.type = type
-        self.line = line
-        self.speed = speed * 10
-        self.alpha = ALPHA_MAX
-        self.correct_code = [1, 2, 3, 4]
-        self.correct = -1
+        self.note = None
+        self.note_id = -1                                       # notes are pooled too: id tells if it is ours
+        self.scale = game.render_scale                          # note x / y: layout units
+        self.image = self.game.atlas.scaled("enemy1", ENEMY_SIZE[0])
+        self.rect = self.image.get_rect()
+
+    def spawn(self, note):
+        self.note = note
+        self.note_id = note.id
+        self.type = note.type
+        self.line = note.line
+        self.speed = note.speed
 
         if self.type == 1:
-            enemy1 = pygame.transform.scale(self.game.spr_enemy1, (100, 100))
-            self.image = enemy1
+            self.image = self.game.atlas.scaled("enemy1", ENEMY_SIZE[0])
         elif self.type == 2:
-            enemy2 = pygame.transform.scale(self.game.spr_enemy2, (120, 120))
-            self.image = enemy2
+            self.image = self.game.atlas.scaled("enemy2", ENEMY_SIZE[1])
         else:
-            enemy3 = pygame.transform.scale(self.game.spr_enemy3, (120, 120))
-            self.image = enemy3
+            self.image = self.game.atlas.scaled("enemy3", ENEMY_SIZE[2])
 
-        self.touch_coord = (50, 50)
-        self.rect = self.image.get_rect()
-        self.rect.x = WIDTH
-
-        if self.line == 0:
-            self.rect.y = HEIGHT / 4 - 30
-        else:
-            self.rect.y = HEIGHT / 2
-
-        self.rect.x += self.touch_coord[0]
-        self.rect.y += self.touch_coord[1]
+        self.rect.size = self.image.get_size()
+        self.rect.x = note.x * self.scale
+        self.rect.y = note.y * self.scale
 
     def update(self):
-        self.image.set_alpha(self.alpha)
-
-        if self.alpha > 0:
-            self.rect.x -= self.speed
-
-            if self.rect.x > WIDTH * 2 or self.rect.x < -WIDTH:
-                self.kill()
+        if self.note.alive and self.note.id == self.note_id:
+            self.rect.x = self.note.x * self.scale
         else:
-            self.kill()
+            self.release()
+
+    def release(self):
+        self.kill()
+        self.note = None
+        self.game.enemy_pool.append(self)
 
 class BackGround():
     def __init__(self, game):
@@ -807,19 +1162,16 @@ class BackGround():
         self.y2 = 0
         self.x2 = self.rect.width
 
-        self.speed = 20
+        self.speed = 20 * FPS / 1000 * game.render_scale        # pixel per ms (20 units per frame at FPS)
 
-    def update(self):
-        self.x1 -= self.speed
-        self.x2 -= self.speed
-        if self.x1 <= -self.rect.width:
-            self.x1 = self.rect.width
-        if self.x2 <= -self.rect.width:
-            self.x2 = self.rect.width
+    def update(self):                                           # scroll by elapsed time, not by frame count
+        self.x1 = -(int(pygame.time.get_ticks() * self.speed % self.rect.width) // 2 * 2)    # even x blits faster
+        self.x2 = self.x1 + self.rect.width
 
 
 if __name__ == "__main__":
     game = MuseRush()
     while game.running:
         game.run()
+    game.scores.close()                                         # wait for pending score writes
     pygame.quit()
\ No newline at end of file
@@ -0,0 +1,83 @@
+import io
+import os
+import mmap
+import struct
+import pygame
+
+PCM_EXT = ".pcm"                                                # decoded song next to the music file (a wav file)
+PCM_VERSION = 1
+PCM_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sIIqq4sI")          # RIFF, fmt chunk, source chunk (version, mtime_ns,
+                                                                # size of the song file), data chunk header
+
+
+class PcmTrack:                                                 # Decoded Song (music stream with exact seeks)
+    def __init__(self, source, frequency, channels, frames):
+        self.source = source                                    # mmap (BytesIO: cache not writable), a wav file
+        self.frequency = frequency
+        self.channels = channels
+        self.frames = frames
+
+    @property
+    def duration(self):                                         # ms
+        return self.frames * 1000 // self.frequency
+
+
+def pcm_path(path):
+    return os.path.splitext(path)[0] + PCM_EXT
+
+
+def pcm_header(stat, data_size):                                # wav header in the mixer format
+    frequency, size, channels = pygame.mixer.get_init()
+    bits = abs(size)
+    block_align = channels * bits // 8
+    return PCM_HEADER.pack(b"RIFF", PCM_HEADER.size - 8 + data_size, b"WAVE",
+                           b"fmt ", 16, 3 if bits == 32 else 1, channels, frequency, frequency * block_align,
+                           block_align, bits,
+                           b"MRsr", 20, PCM_VERSION, stat.st_mtime_ns, stat.st_size,
+                           b"data", data_size)
+
+
+def load_pcm(path):                                             # decoded song, rebuilt when the song file changes
+    stat = os.stat(path)
+    frequency, size, channels = pygame.mixer.get_init()
+    block_align = channels * abs(size) // 8
+
+    try:
+        with open(pcm_path(path), 'rb') as pcm_file:
+            pcm_map = mmap.mmap(pcm_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):                               # missing or empty cache
+        pcm_map = None
+
+    if pcm_map is not None:
+        data_size = len(pcm_map) - PCM_HEADER.size
+
+        if data_size >= 0 and data_size % block_align == 0\
+                and pcm_map[:PCM_HEADER.size] == pcm_header(stat, data_size):
+            return PcmTrack(pcm_map, frequency, channels, data_size // block_align)
+
+        pcm_map.close()                                         # stale (song or mixer format changed) or damaged
+
+    return decode_pcm(path, stat)
+
+
+def decode_pcm(path, stat=None):                                # decoded once by the mixer, then memory-mapped
+    stat = stat if stat is not None else os.stat(path)
+    frequency, size, channels = pygame.mixer.get_init()
+    samples = pygame.mixer.Sound(path).get_raw()               # already in the mixer format
+    header = pcm_header(stat, len(samples))
+    cache_path = pcm_path(path)
+    temp_path = cache_path + ".tmp"
+
+    try:
+        with open(temp_path, 'wb') as pcm_file:
+            pcm_file.write(header)
+            pcm_file.write(samples)
+
+        os.replace(temp_path, cache_path)
+
+        with open(cache_path, 'rb') as pcm_file:
+            source = mmap.mmap(pcm_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except OSError:                                             # read-only song folder: keep it in memory
+        source = io.BytesIO(header + samples)
+
+    return PcmTrack(source, frequency, channels, len(samples) * 8 // (channels * abs(size)))
@@ -0,0 +1,84 @@
+import csv
+import json
+import time
+from array import array
+
+STAGES = ["wait", "events", "update", "draw", "present"]       # stages of MuseRush.run
+
+
+class FrameProfiler:                                            # Per-Stage Frame Timer (ring buffer)
+    def __init__(self, size=1200):
+        self.size = size
+        self.samples = [array('q', [0]) * size for _ in STAGES]    # ns per stage
+        self.modes = array('b', [0]) * size                     # screen mode of the frame
+        self.enemies = array('i', [0]) * size                   # live enemy count of the frame
+        self.frames = array('q', [0]) * size                    # frame number
+        self.late = array('b', [0]) * size                      # 1: the frame missed its pacing deadline
+        self.count = 0                                          # frames recorded
+        self.stage = 0
+        self.last_ns = 0
+        self.overlay = False                                    # on-screen overlay toggle
+
+    def start(self):
+        self.stage = 0
+        self.last_ns = time.perf_counter_ns()
+
+    def mark(self, stage):                                      # end of a stage (STAGES order)
+        now = time.perf_counter_ns()
+        self.samples[STAGES.index(stage)][self.count % self.size] = now - self.last_ns
+        self.last_ns = now
+
+    def end(self, screen_mode, enemy_count, late=False):
+        index = self.count % self.size
+        self.late[index] = late
+        self.modes[index] = screen_mode
+        self.enemies[index] = enemy_count
+        self.frames[index] = self.count
+        self.count += 1
+
+    def recorded(self):                                         # ring indexes in frame order
+        if self.count <= self.size:
+            return range(self.count)
+
+        start = self.count % self.size
+        return [(start + i) % self.size for i in range(self.size)]
+
+    def percentiles(self, stage=None, points=(50, 95, 99)):     # ms; stage None: whole frame
+        indexes = self.recorded()
+
+        if stage is None:
+            values = sorted(sum(samples[i] for samples in self.samples) for i in indexes)
+        else:
+            samples = self.samples[STAGES.index(stage)]
+            values = sorted(samples[i] for i in indexes)
+
+        if len(values) == 0:
+            return [0.0 for _ in points]
+
+        return [values[min(len(values) - 1, len(values) * p // 100)] / 1000000 for p in points]
+
+    def missed(self):                                           # late frames in the ring
+        return sum(self.late[i] for i in self.recorded())
+
+    def summary(self):
+        summary = {stage: self.percentiles(stage) for stage in STAGES}
+        summary["frame"] = self.percentiles()
+        return summary
+
+    def rows(self):
+        for i in self.recorded():
+            stage_us = [self.samples[s][i] // 1000 for s in range(len(STAGES))]
+            yield [self.frames[i], self.modes[i], self.enemies[i]] + stage_us + [sum(stage_us), self.late[i]]
+
+    def dump(self, path):                                       # .json or .csv (by extension)
+        header = ["frame", "screen_mode", "enemies"] + [stage + "_us" for stage in STAGES] + ["total_us", "late"]
+
+        if path.endswith(".json"):
+            with open(path, 'w', encoding="UTF-8") as dump_file:
+                json.dump({"summary_ms": self.summary(), "missed": self.missed(),
+                           "frames": [dict(zip(header, row)) for row in self.rows()]}, dump_file, indent=1)
+        else:
+            with open(path, 'w', encoding="UTF-8", newline='') as dump_file:
+                writer = csv.writer(dump_file)
+                writer.writerow(header)
+                writer.writerows(self.rows())
@@ -0,0 +1,236 @@
+import os
+import sys
+import time
+import zlib
+import struct
+import argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from settings import TARGET_SIZE
+from chart import load_compiled
+from simulation import Simulation
+
+REPLAY_EXT = ".mrp"
+REPLAY_MAGIC = b"MRP1"
+REPLAY_VERSION = 1
+REPLAY_HEADER = struct.Struct("<4sI20siHHIIH")                  # magic, version, chart digest, score, target size,
+                                                                # events, payload bytes, song name bytes
+SPAWN = 0                                                       # event kinds (press: PRESS + lane)
+EXPIRE = 1
+PRESS = 2
+
+charts = dict()                                                 # chart path -> Chart (per worker process)
+
+
+class Replay:                                                   # Simulation Input Stream (spawn / press / expire)
+    def __init__(self, digest=b"", target_size=TARGET_SIZE, song=""):
+        self.digest = digest                                    # Chart.digest of the played chart
+        self.target_size = tuple(target_size)
+        self.song = song
+        self.score = 0                                          # final score of the recorded run
+        self.kinds = array('b')
+        self.times = array('i')                                 # song time (ms)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def spawn(self, song_time):                                 # a chart row was spawned
+        self.kinds.append(SPAWN)
+        self.times.append(int(song_time))
+
+    def press(self, lane, song_time):
+        self.kinds.append(PRESS + lane)
+        self.times.append(int(song_time))
+
+    def expire(self, song_time):                                # notes left their lane as missed
+        self.kinds.append(EXPIRE)
+        self.times.append(int(song_time))
+
+    def to_bytes(self):                                         # times are stored as deltas, then deflated
+        deltas = array('i', [self.times[0]] if len(self.times) else [])
+        deltas.extend(self.times[i] - self.times[i - 1] for i in range(1, len(self.times)))
+
+        if sys.byteorder == "big":
+            deltas.byteswap()
+
+        payload = zlib.compress(self.kinds.tobytes() + deltas.tobytes(), 9)
+        song = self.song.encode("UTF-8")[:0xffff]
+        return REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.digest, self.score, self.target_size[0],
+                                  self.target_size[1], len(self.kinds), len(payload), len(song)) + song + payload
+
+    @classmethod
+    def from_bytes(cls, data):
+        if len(data) < REPLAY_HEADER.size:
+            raise ValueError("replay is too short")
+
+        magic, version, digest, score, target_w, target_h, events, payload_size, song_size\
+            = REPLAY_HEADER.unpack_from(data)
+
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError("not a version " + str(REPLAY_VERSION) + " replay")
+
+        offset = REPLAY_HEADER.size
+        replay = cls(digest, (target_w, target_h), data[offset:offset + song_size].decode("UTF-8"))
+        replay.score = score
+
+        try:
+            payload = zlib.decompress(data[offset + song_size:offset + song_size + payload_size])
+        except zlib.error as e:
+            raise ValueError("damaged replay (" + str(e) + ")")
+
+        if len(payload) != events * 5:
+            raise ValueError("damaged replay (" + str(events) + " events, " + str(len(payload)) + " bytes)")
+
+        replay.kinds.frombytes(payload[:events])
+        deltas = array('i')
+        deltas.frombytes(payload[events:])
+
+        if sys.byteorder == "big":
+            deltas.byteswap()
+
+        song_time = 0
+
+        for delta in deltas:
+            song_time += delta
+            replay.times.append(song_time)
+
+        return replay
+
+    def save(self, path):                                       # written next to it, then renamed
+        temp_path = path + ".tmp"
+
+        with open(temp_path, 'wb') as replay_file:
+            replay_file.write(self.to_bytes())
+
+        os.replace(temp_path, path)
+
+
+def load_replay(path):
+    with open(path, 'rb') as replay_file:
+        return Replay.from_bytes(replay_file.read())
+
+
+def replay_name(song):                                          # "<song>-<date>-<time>.mrp"
+    return song + time.strftime("-%Y%m%d-%H%M%S") + REPLAY_EXT
+
+
+def play(chart, replay):                                        # re-simulate without rendering
+    sim = Simulation(chart, replay.target_size)
+
+    for kind, song_time in zip(replay.kinds, replay.times):
+        if kind == SPAWN:
+            sim.move(song_time)                                 # returns passed notes to the pool
+            sim.spawn(song_time)
+        elif kind == EXPIRE:
+            sim.expire(song_time)
+        else:
+            sim.press(kind - PRESS, song_time)
+
+    return sim
+
+
+def verify(chart, replay):                                      # (True if the score is reproduced, score)
+    if replay.digest != chart.digest:
+        return False, -1
+
+    score = play(chart, replay).score
+    return score == replay.score, score
+
+
+def verify_file(path, chart_path):                              # report for one replay (process pool worker)
+    report = {"replay": path, "chart": chart_path, "ok": False, "score": -1, "error": ""}
+
+    try:
+        replay = load_replay(path)
+        report["recorded_score"] = replay.score
+        report["events"] = len(replay)
+
+        if chart_path is None:
+            report["error"] = "no chart with digest " + replay.digest.hex()
+            return report
+
+        if chart_path not in charts:
+            charts[chart_path] = load_compiled(chart_path)
+
+        start = time.perf_counter()
+        report["ok"], report["score"] = verify(charts[chart_path], replay)
+        report["wall_ms"] = (time.perf_counter() - start) * 1000
+
+        if not report["ok"]:
+            report["error"] = "score " + str(report["score"]) + " != recorded " + str(replay.score)
+    except (OSError, ValueError) as e:
+        report["error"] = str(e)
+
+    return report
+
+
+def chart_digests(song_dir):                                    # Chart.digest -> chart path
+    digests = dict()
+
+    for chart_name in sorted(i for i in os.listdir(song_dir) if i.endswith(".ini")):
+        chart_path = os.path.join(song_dir, chart_name)
+        digests[load_compiled(chart_path).digest] = chart_path  # also writes the .mrc before workers start
+
+    return digests
+
+
+def replay_paths(paths):                                        # files as given, directories expanded
+    for path in paths:
+        if os.path.isdir(path):
+            for replay_file in sorted(os.listdir(path)):
+                if replay_file.endswith(REPLAY_EXT):
+                    yield os.path.join(path, replay_file)
+        else:
+            yield path
+
+
+def verify_all(paths, song_dir, workers=None):
+    digests = chart_digests(song_dir)
+    jobs = list()
+
+    for path in replay_paths(paths):
+        try:
+            with open(path, 'rb') as replay_file:
+                header = replay_file.read(REPLAY_HEADER.size)
+
+            digest = REPLAY_HEADER.unpack(header)[2] if len(header) == REPLAY_HEADER.size else b""
+        except OSError:
+            digest = b""
+
+        jobs.append((path, digests.get(digest)))
+
+    if workers == 1 or len(jobs) < 2:
+        return [verify_file(path, chart_path) for path, chart_path in jobs]
+
+    with ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(verify_file, [i[0] for i in jobs], [i[1] for i in jobs],
+                                 chunksize=max(1, len(jobs) // (8 * (workers or os.cpu_count() or 1)))))
+
+
+def main(argv):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Muse Rush replay verifier (re-simulates without rendering)")
+    parser.add_argument("replays", nargs='*', default=[os.path.join(base_dir, "replays")],
+                        help="replay files or directories")
+    parser.add_argument("--songs", default=os.path.join(base_dir, "song"), help="chart directory")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: cpu count, 1: no pool)")
+    args = parser.parse_args(argv[1:])
+
+    start = time.perf_counter()
+    reports = verify_all(args.replays, args.songs, args.workers)
+    wall_ms = (time.perf_counter() - start) * 1000
+    failed = 0
+
+    for report in reports:
+        if report["ok"]:
+            print("ok      %s: score %d, %d events" % (report["replay"], report["score"], report["events"]))
+        else:
+            print("FAILED  %s: %s" % (report["replay"], report["error"]))
+            failed += 1
+
+    print("%d replays, %d failed, %.1f ms" % (len(reports), failed, wall_ms))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
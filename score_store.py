@@ -0,0 +1,97 @@
+import os
+import json
+import queue
+import threading
+
+COMPACT_LINES = 1000                                            # rewrite the journal when it grows past this
+
+
+class ScoreStore:                                               # High Scores (append-only journal)
+    def __init__(self, path):
+        self.path = path
+        self.scores = dict()                                    # song name -> high score
+        self.lines = 0                                          # journal lines on disk
+        self.load()
+
+        if self.lines > max(COMPACT_LINES, 2 * len(self.scores)):
+            self.compact()
+
+        self.writes = queue.Queue()                             # records waiting for the writer thread
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding="UTF-8") as journal:
+                journal_text = journal.read()
+        except OSError:
+            return
+
+        for line in journal_text.split('\n'):
+            try:
+                record = json.loads(line)
+                self.scores[record["song"]] = max(record["score"], self.scores.get(record["song"], 0))
+                self.lines += 1
+            except (ValueError, KeyError, TypeError):           # torn line from a crash mid-write
+                continue
+
+        if journal_text != "" and not journal_text.endswith('\n'):
+            try:
+                with open(self.path, 'a', encoding="UTF-8") as journal:
+                    journal.write('\n')                         # next record starts on its own line
+            except OSError:
+                pass
+
+    def compact(self):                                          # one line per song, replaced atomically
+        temp_path = self.path + ".tmp"
+
+        try:
+            with open(temp_path, 'w', encoding="UTF-8") as journal:
+                for song in sorted(self.scores):
+                    journal.write(json.dumps({"song": song, "score": self.scores[song]}) + '\n')
+
+                journal.flush()
+                os.fsync(journal.fileno())
+
+            os.replace(temp_path, self.path)
+            self.lines = len(self.scores)
+        except OSError:
+            pass
+
+    def get(self, song, default=-1):
+        return self.scores.get(song, default)
+
+    def submit(self, song, score):                              # returns at once, the writer thread saves it
+        if score < self.scores.get(song, -1):
+            return False
+
+        self.scores[song] = score
+        self.writes.put({"song": song, "score": score})
+        return True
+
+    def write_loop(self):
+        while True:
+            record = self.writes.get()
+
+            if record is None:
+                self.writes.task_done()
+                break
+
+            try:
+                with open(self.path, 'a', encoding="UTF-8") as journal:
+                    journal.write(json.dumps(record) + '\n')
+                    journal.flush()
+                    os.fsync(journal.fileno())
+
+                self.lines += 1
+            except OSError as e:
+                print("error: score is not saved (" + str(e) + ")")
+
+            self.writes.task_done()
+
+    def flush(self):                                            # wait until every submitted score is on disk
+        self.writes.join()
+
+    def close(self):
+        self.writes.put(None)
+        self.writer.join()
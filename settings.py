@@ -0,0 +1,55 @@
+TITLE = "Muse Rush"                                             # default setting
+WIDTH = 1280
+HEIGHT = 720
+FPS = 60                                                        # logic steps per second (and the unit of speeds)
+DEFAULT_FONT = "Excludeditalic-jEr99.ttf"
+
+WHITE = (255, 255, 255)                                         # color setting
+BLACK = (32, 36, 32)
+RED = (246, 36, 74)
+BLUE = (32, 105, 246)
+ALPHA_MAX = 255     # do not change (fix 255)
+
+PLAYER_SIZE = (180, 180)                                        # sprite setting
+ENEMY_SIZE = [(100, 100), (120, 120), (120, 120)]               # enemy type 1, 2, 3
+LOGO_PULSE = range(-10, 11)                                     # logo rescale offsets (screen_value[1])
+TARGET_SIZE = (85, 85)                                          # target.png size (headless simulation)
+
+PERFECT_WINDOW = 40                                             # judgment setting (ms from the hit time)
+GOOD_WINDOW = 90
+MISS_WINDOW = 150                                               # early press inside this window is a miss
+COUNTDOWN = 3000                                                # ms before a song starts (chart / song load meanwhile)
+
+PRACTICE_SEEK = 5000                                            # practice setting (ms per left / right key)
+
+AUDIO_FREQUENCY = 44100                                         # audio setting (pre_init before pygame.init)
+AUDIO_BUFFER = 256                                              # samples per mixer buffer (lower: less latency)
+AUDIO_CHANNELS = 16
+VOICE_CHANNELS = {"hit": 2, "miss": 2, "damage": 1}             # reserved channels (most instances at once)
+AUDIO_LATENCY = -1                                              # ms added to play time (-1: two mixer buffers)
+AUDIO_OFFSET = 0                                                # calibration ms on top (+: the music is heard later)
+AUDIO_SYNC = True                                               # play time follows mixer.music.get_pos()
+SKEW_LOG = ""                                                   # "skew.csv": audio / clock skew per frame of a song
+
+FRAME_RATE = FPS                                                # pacing setting (frames drawn per second, 0: uncapped,
+                                                                # -1: display refresh rate, needs pygame-ce)
+FRAME_BUSY_MS = 0                                               # spin the last ms before a frame (precise, one core)
+FRAME_STEPS_MAX = 5                                             # logic steps per frame at most (after a stall)
+
+DIRTY_RENDER = False                                            # render setting (True: play screen redraws changed
+                                                                # regions only, the background stops scrolling)
+RENDER_SCALE = 1                                                # internal resolution (0.5 - 1: frames drawn smaller
+                                                                # and scaled up to the window, layout unchanged)
+
+LAYER_CACHE_SIZE = 20                                           # menu background layers kept (one per fade step)
+
+PROFILE_FRAMES = 1200                                           # profiler setting (frames kept in the ring buffer)
+PROFILE_FILE = ""                                               # "profile.csv" / "profile.json": written on exit
+
+REPLAY_DIR = "replays"                                          # replay setting (finished songs, "": not recorded)
+
+TELEMETRY_SIZE = 65536                                          # telemetry setting (events kept in the ring buffer)
+TELEMETRY_FILE = ""                                             # "telemetry.ndjson": event trace of the last song
+
+ASSET_WORKERS = 4                                               # startup setting (png / wav decode threads)
+STARTUP_REPORT = False                                          # True: print the time to first frame / main screen
@@ -0,0 +1,373 @@
+import os
+import sys
+import time
+from bisect import bisect_left
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:                                             # positions fall back to a python loop
+    np = None
+
+from settings import *
+from chart import END, LINE_UPPER, LINE_LOWER, load_chart, read_header, screen_time
+from telemetry import SPAWN, PRESS, HIT, MISS_PRESS, EXPIRE
+
+PERFECT = 100                                                   # judgment (score value)
+GOOD = 50
+MISS = 0
+SPAWN_X = WIDTH + 50                                            # note x at its chart time
+
+
+class Note:                                                     # Enemy State (no pygame)
+    __slots__ = ["pool", "slot", "id", "type", "lane", "line", "speed", "spawn_time", "hit_time", "width", "height",
+                 "y", "alive", "judged"]
+
+    def __init__(self, pool=None, slot=-1):
+        self.pool = pool                                        # position lives in the pool arrays
+        self.slot = slot
+        self.reset(-1, 1, 0, 1, 0)
+        self.alive = False
+
+    def reset(self, id, type, lane, speed, spawn_time):
+        self.id = id                                            # chart note index
+        self.type = type
+        self.lane = lane                                        # 0: upper, 1: lower
+        self.line = LINE_UPPER if lane == 0 else LINE_LOWER
+        self.speed = speed * 10                                 # pixel per frame (at FPS)
+        self.spawn_time = spawn_time
+        self.hit_time = spawn_time                              # ideal hit time (ms), set by Simulation.spawn
+        self.width, self.height = ENEMY_SIZE[type - 1]
+        self.y = int(HEIGHT / 4 - 30 if lane == 0 else HEIGHT / 2) + 50
+        self.alive = True                                       # on screen
+        self.judged = False                                     # removed from its lane queue
+        return self
+
+    @property
+    def x(self):
+        return int(self.pool.xs[self.slot]) if self.pool is not None else SPAWN_X
+
+
+class NotePool:                                                 # Reusable Notes + Array-Backed Positions
+    def __init__(self, size=0):
+        self.notes = list()                                     # slot -> Note
+        self.free = list()
+        self.origins = self.new_array(0)                        # x = origin - speed * song_time
+        self.speeds = self.new_array(0)                         # pixel per ms
+        self.cull_times = self.new_array(0)                     # song time the note leaves the screen (inf: free)
+        self.xs = self.new_array(0)
+        self.next_cull = float("inf")                           # earliest cull time (lower bound)
+        self.grow(max(size, 1))
+
+    @property
+    def allocated(self):                                        # notes ever created
+        return len(self.notes)
+
+    def new_array(self, size, value=0):
+        return [float(value)] * size if np is None else np.full(size, float(value))
+
+    def extend(self, values, size, value=0):
+        added = self.new_array(size, value)
+        return values + added if np is None else np.concatenate([values, added])
+
+    def grow(self, size):
+        start = len(self.notes)
+        self.origins = self.extend(self.origins, size)
+        self.speeds = self.extend(self.speeds, size)
+        self.cull_times = self.extend(self.cull_times, size, "inf")
+        self.xs = self.extend(self.xs, size)
+        self.notes += [Note(self, slot) for slot in range(start, start + size)]
+        self.free += reversed(self.notes[start:])
+
+    def acquire(self, id, type, lane, speed, spawn_time):
+        if not self.free:
+            self.grow(len(self.notes))
+
+        note = self.free.pop().reset(id, type, lane, speed, spawn_time)
+        speed = note.speed * FPS / 1000
+        self.origins[note.slot] = SPAWN_X + speed * spawn_time
+        self.speeds[note.slot] = speed
+        self.cull_times[note.slot] = spawn_time + (SPAWN_X + WIDTH) / speed
+        self.next_cull = min(self.next_cull, self.cull_times[note.slot])
+        self.xs[note.slot] = SPAWN_X
+        return note
+
+    def release(self, note):
+        self.cull_times[note.slot] = float("inf")
+        self.free.append(note)
+
+    def move(self, song_time):                                  # x of every note at song_time, off-screen list
+        if np is None:
+            self.xs = [origin - speed * song_time for origin, speed in zip(self.origins, self.speeds)]
+        else:
+            np.subtract(self.origins, np.multiply(self.speeds, song_time), out=self.xs)
+
+        if song_time <= self.next_cull:
+            return list()
+
+        if np is None:
+            culled = [note for note in self.notes if self.cull_times[note.slot] < song_time]
+        else:
+            culled = [self.notes[slot] for slot in np.flatnonzero(self.cull_times < song_time)]
+
+        for note in culled:
+            self.cull_times[note.slot] = float("inf")           # caller releases them
+
+        self.next_cull = float(min(self.cull_times) if np is None else self.cull_times.min())
+        return culled
+
+
+class Simulation:                                               # Chart Playback / Enemy Movement / Judgment
+    def __init__(self, chart, target_size=TARGET_SIZE, pool=None, replay=None, telemetry=None):
+        self.chart = chart
+        self.replay = replay                                    # records spawn / press / expire (replay.Replay)
+        self.telemetry = telemetry                              # records timing of every event (telemetry.Telemetry)
+        self.song_dataIndex = 0
+        self.song_time = 0                                      # injected clock (ms)
+        self.notes = dict()                                     # live notes in spawn order (dict: O(1) removal)
+        self.pool = pool if pool is not None else NotePool(chart.peak_notes)
+        self.lanes = [deque(), deque()]                         # unjudged notes per lane in hit time order
+        self.score = 0
+        self.finished = False
+
+        touch_coord = (round(target_size[0] / 2), round(target_size[1] / 2))
+        target_x = int(WIDTH / 8 + touch_coord[0] + 100)
+        self.targets = [(target_x, int(HEIGHT / 4 + touch_coord[1])) + tuple(target_size),        # upper
+                        (target_x, int(HEIGHT / 2 + touch_coord[1] + 40)) + tuple(target_size)]   # lower
+
+    def travel_time(self, note):                                # ms from spawn until centered on the target
+        target_x, target_y, target_w, target_h = self.targets[note.lane]
+        distance = SPAWN_X - (target_x + (target_w - note.width) / 2)
+        return distance / note.speed * 1000 / FPS
+
+    def spawn(self, song_time):                                 # every chart row due at song_time (create_enemy)
+        spawned = list()
+
+        if self.finished:
+            return spawned
+
+        chart = self.chart
+
+        while self.song_dataIndex < len(chart) and song_time >= chart.times[self.song_dataIndex]:
+            for i in range(chart.starts[self.song_dataIndex], chart.starts[self.song_dataIndex + 1]):
+                note = self.pool.acquire(i, chart.types[i], chart.lanes[i], chart.speeds[i],
+                                         chart.times[self.song_dataIndex])
+                note.hit_time = note.spawn_time + self.travel_time(note)
+                self.notes[note] = None
+                self.queue(note)
+                spawned.append(note)
+
+                if self.telemetry is not None:                  # offset: spawn lateness (frame time)
+                    self.telemetry.record(SPAWN, song_time, note.lane, i, song_time - note.spawn_time)
+
+            self.song_dataIndex += 1
+
+            if self.replay is not None:                         # one event per row, as before
+                self.replay.spawn(song_time)
+
+        if self.song_dataIndex >= len(chart):                   # END line (or end of a chart without one)
+            if chart.end_time == END or song_time >= chart.end_time:
+                self.finished = True
+
+        return spawned
+
+    def seek(self, song_time):                                  # practice: chart state at song_time (no replay)
+        for note in list(self.notes):
+            self.kill(note)
+
+        chart = self.chart
+        self.song_dataIndex = bisect_left(chart.times, song_time - screen_time(1))    # slowest note still on screen
+        self.song_time = song_time
+        self.finished = False
+        spawned = list()
+
+        while self.song_dataIndex < len(chart) and chart.times[self.song_dataIndex] <= song_time:
+            for i in range(chart.starts[self.song_dataIndex], chart.starts[self.song_dataIndex + 1]):
+                note = self.pool.acquire(i, chart.types[i], chart.lanes[i], chart.speeds[i],
+                                         chart.times[self.song_dataIndex])
+                note.hit_time = note.spawn_time + self.travel_time(note)
+
+                if note.hit_time < song_time:                   # already past the target
+                    self.pool.release(note)
+                    continue
+
+                self.notes[note] = None
+                self.queue(note)
+                spawned.append(note)
+
+            self.song_dataIndex += 1
+
+        self.move(song_time)
+        return spawned
+
+    def queue(self, note):                                      # insert keeping the lane in hit time order
+        lane = self.lanes[note.lane]
+        index = len(lane)
+
+        while index > 0 and lane[index - 1].hit_time > note.hit_time:
+            index -= 1
+
+        lane.insert(index, note)
+
+    def press(self, lane, song_time=None):                      # lane 0: upper (S, D), 1: lower (L, ;)
+        song_time = self.song_time if song_time is None else song_time
+
+        if self.replay is not None:
+            self.replay.press(lane, song_time)
+
+        if self.telemetry is not None:
+            self.telemetry.record(PRESS, song_time, lane)
+
+        if len(self.lanes[lane]) == 0:
+            return MISS, None, None
+
+        note = self.lanes[lane][0]
+        offset = song_time - note.hit_time                      # negative: early
+
+        if offset < -MISS_WINDOW:                               # too early: the note is not touched
+            return MISS, None, None
+
+        self.lanes[lane].popleft()
+        note.judged = True
+
+        if abs(offset) <= PERFECT_WINDOW:
+            judgment = PERFECT
+        elif abs(offset) <= GOOD_WINDOW:
+            judgment = GOOD
+        else:
+            judgment = MISS
+
+        if judgment != MISS:
+            self.score += judgment
+            self.kill(note)
+
+        if self.telemetry is not None:
+            self.telemetry.record(HIT if judgment != MISS else MISS_PRESS, song_time, lane, note.id, offset)
+
+        return judgment, note, offset
+
+    def expire(self, song_time):                                # notes past the good window are missed
+        expired = list()
+
+        for lane in self.lanes:
+            while lane and song_time - lane[0].hit_time > GOOD_WINDOW:
+                note = lane.popleft()
+                note.judged = True
+                expired.append(note)
+
+                if self.telemetry is not None:
+                    self.telemetry.record(EXPIRE, song_time, note.lane, note.id, song_time - note.hit_time)
+
+        if expired and self.replay is not None:
+            self.replay.expire(song_time)
+
+        return expired
+
+    def move(self, song_time=None):                             # note positions at song_time, cull off-screen
+        for note in self.pool.move(self.song_time if song_time is None else song_time):
+            self.kill(note)
+
+    def kill(self, note):                                       # off screen or hit: back to the pool
+        note.alive = False
+        del self.notes[note]
+
+        if not note.judged:
+            self.lanes[note.lane].remove(note)
+            note.judged = True
+
+        self.pool.release(note)
+
+    def step(self, song_time, presses=()):                     # one game frame: events -> update
+        spawned = self.spawn(self.song_time)
+
+        for press_time, lane in presses:
+            self.press(lane, press_time)
+
+        self.move(song_time)
+        self.song_time = song_time
+        self.expire(song_time)
+        return spawned
+
+    def autoplay_presses(self):                                 # press each lane when its head note is due
+        return [(self.song_time, lane) for lane in range(2)
+                if self.lanes[lane] and self.lanes[lane][0].hit_time <= self.song_time]
+
+
+def run(chart, inputs=(), autoplay=False, frame_ms=1000 / FPS, max_time=None, replay=None):
+    sim = Simulation(chart, replay=replay)
+
+    if max_time is None:                                        # a chart without END stops after its last row
+        max_time = (chart.end_time if chart.end_time != END else (chart.times[-1] if len(chart) else 0)) + 60000
+    inputs = sorted(inputs)                                     # [(press time ms, lane), ...]
+    input_index = 0
+    frame = 0
+
+    while not sim.finished and sim.song_time <= max_time:
+        presses = list()
+        frame += 1
+        song_time = round(frame * frame_ms)
+
+        while input_index < len(inputs) and inputs[input_index][0] <= song_time:
+            presses.append(inputs[input_index])
+            input_index += 1
+
+        if autoplay:
+            presses += sim.autoplay_presses()
+
+        sim.step(song_time, presses)
+
+    return sim
+
+
+def validate(path):                                             # parse + autoplay one chart
+    report = {"chart": os.path.basename(path), "errors": list()}
+
+    try:
+        report["high_score"], report["perfect_score"] = read_header(path)
+    except (ValueError, IndexError) as e:
+        report["errors"].append((1, "header", str(e)))
+        report["perfect_score"] = -1
+
+    malformed = list()
+    chart = load_chart(path, malformed)
+    report["errors"] += malformed
+    report["notes"] = chart.note_count
+    report["has_end"] = chart.end_time != END
+
+    if not report["has_end"]:
+        report["errors"].append((0, "", "no END line"))
+
+    start = time.perf_counter()
+    sim = run(chart, autoplay=True)
+    report["wall_ms"] = (time.perf_counter() - start) * 1000
+    report["song_ms"] = sim.song_time
+    report["autoplay_score"] = sim.score
+
+    if sim.score != report["perfect_score"]:
+        report["errors"].append((0, "", "autoplay score " + str(sim.score) + " != perfect score "
+                                 + str(report["perfect_score"])))
+
+    return report
+
+
+def main(argv):
+    song_dir = argv[1] if len(argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "song")
+    charts = sorted(i for i in os.listdir(song_dir) if i.endswith(".ini"))
+    failed = 0
+
+    for chart_name in charts:
+        report = validate(os.path.join(song_dir, chart_name))
+        speedup = report["song_ms"] / max(report["wall_ms"], 0.001)
+        print("%s: %d notes, score %d/%d, %.1f ms (%.0fx real time)" % (report["chart"], report["notes"],
+              report["autoplay_score"], report["perfect_score"], report["wall_ms"], speedup))
+
+        for line_num, line, message in report["errors"]:
+            print("    line %d: %s" % (line_num, message) if line_num else "    " + message)
+
+        failed += 1 if report["errors"] else 0
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
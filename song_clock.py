@@ -0,0 +1,84 @@
+import csv
+import time
+import pygame
+from array import array
+
+DRIFT_GAIN = 0.05                                               # part of the skew corrected per frame
+RATE_GAIN = 0.002                                               # skew -> audio clock rate estimate (integral term)
+SNAP_MS = 200                                                   # larger skew (start-up, underrun): jump to the audio
+
+
+class SongClock:                                                # Song Time from the Music Position
+    def __init__(self, latency=0):
+        self.latency = latency                                  # ms between mixing and hearing (+ calibration)
+        self.epoch = time.perf_counter() * 1000 - pygame.time.get_ticks()    # perf_counter on the tick timeline
+        self.origin = 0.0                                       # tick of song time 0
+        self.offset = 0                                         # song time of the play() start (practice seeks)
+        self.last_tick = 0.0
+        self.skew = 0.0                                         # audio - clock song time of the last frame (ms)
+        self.drift = 0.0                                        # audio ms per clock ms - 1
+        self.snaps = 0
+        self.ticks = array('d')                                 # skew log of the song
+        self.song_times = array('d')
+        self.audio_times = array('d')
+        self.skews = array('d')
+
+    def now(self):                                              # sub-millisecond pygame tick
+        return time.perf_counter() * 1000 - self.epoch
+
+    def start(self, offset=0):                                  # right after mixer.music.play(start=offset / 1000)
+        self.last_tick = self.now()
+        self.offset = offset                                    # get_pos counts from the play() call
+        self.origin = self.last_tick + self.latency - offset
+        self.skew = 0.0
+        self.drift = 0.0
+        self.snaps = 0
+
+        self.ticks = array('d')                                 # new logs: a writer thread may hold the last ones
+        self.song_times = array('d')
+        self.audio_times = array('d')
+        self.skews = array('d')
+
+        return round(self.origin)
+
+    def sync(self):                                             # once per frame: start tick (int) for song time
+        now = self.now()
+        elapsed = now - self.last_tick
+        position = pygame.mixer.music.get_pos()
+
+        if position >= 0:                                       # -1: stopped, the clock runs free
+            audio_time = position + self.offset - self.latency
+            self.origin -= self.drift * elapsed
+            self.skew = audio_time - (now - self.origin)
+
+            if abs(self.skew) > SNAP_MS:
+                self.origin = now - audio_time
+                self.snaps += 1
+            else:                                               # slew, song time never runs backwards
+                self.origin -= max(self.skew * DRIFT_GAIN, -elapsed / 2)
+                self.drift += self.skew * RATE_GAIN / max(elapsed, 1)
+
+            self.ticks.append(now)
+            self.song_times.append(now - self.origin)
+            self.audio_times.append(audio_time)
+            self.skews.append(self.skew)
+
+        self.last_tick = now
+        return round(self.origin)
+
+    def summary(self):                                          # skew over the song (ms)
+        count = len(self.skews)
+
+        if count == 0:
+            return {"frames": 0, "mean": 0.0, "stddev": 0.0, "max": 0.0, "snaps": self.snaps}
+
+        mean = sum(self.skews) / count
+        return {"frames": count, "mean": mean, "stddev": (sum((i - mean) ** 2 for i in self.skews) / count) ** 0.5,
+                "max": max(abs(i) for i in self.skews), "snaps": self.snaps}
+
+    def dump(self, path):                                       # csv: one row per synced frame
+        with open(path, 'w', encoding="UTF-8", newline='') as dump_file:
+            writer = csv.writer(dump_file)
+            writer.writerow(["tick_ms", "song_ms", "audio_ms", "skew_ms"])
+            writer.writerows(("%.3f" % a, "%.3f" % b, "%.3f" % c, "%.3f" % d)
+                             for a, b, c, d in zip(self.ticks, self.song_times, self.audio_times, self.skews))
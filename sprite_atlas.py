@@ -0,0 +1,70 @@
+import pygame
+import os
+
+
+class SpriteAtlas:                                              # Decoded / Scaled / Converted Sprite Registry
+    def __init__(self, image_dir, scale=1):
+        self.image_dir = image_dir
+        self.scale = scale                                      # render scale: sizes are given in layout units
+        self.images = dict()                                    # name -> display-format Surface (render scale)
+        self.sizes = dict()                                     # name -> image file size (layout units)
+        self.scaled_images = dict()                             # (name, pixel size) -> display-format Surface
+        self.scale_misses = 0                                   # scales done after load time
+        self.pending = dict()                                   # name -> Future of decode (load_async)
+
+    def load(self, name, filename):
+        self.images[name], self.sizes[name] = self.decode(filename, ())[:2]
+        return self.images[name]
+
+    def load_async(self, executor, name, filename, sizes=()):  # decode, convert and prescale on a worker thread
+        self.pending[name] = executor.submit(self.decode, filename, sizes)
+
+    def decode(self, filename, sizes):                          # worker: (image, unit size, {size: scaled image})
+        image = self.convert(pygame.image.load(os.path.join(self.image_dir, filename)))
+        unit_size = image.get_size()
+
+        if self.scale != 1:                                     # pixel art: nearest neighbour, like the prescales
+            image = pygame.transform.scale(image, self.pixels(unit_size))
+
+        sizes = [self.pixels(size) for size in sizes]
+        return image, unit_size, {size: pygame.transform.scale(image, size) for size in sizes}
+
+    def ready(self, wait=False):                                # stores finished decodes (main thread)
+        for name, future in list(self.pending.items()):
+            if not wait and not future.done():
+                return False
+
+            self.images[name], self.sizes[name], scaled_images = future.result()   # decode errors are raised here
+
+            for size, image in scaled_images.items():
+                self.scaled_images[(name, size)] = image
+
+            del self.pending[name]
+
+        return True
+
+    def convert(self, image):
+        if pygame.display.get_surface() is None:                # headless: keep the decoded format
+            return image
+
+        return image.convert_alpha() if image.get_flags() & pygame.SRCALPHA else image.convert()
+
+    def get(self, name):
+        return self.images[name]
+
+    def size(self, name):                                       # layout units, whatever the render scale
+        return self.sizes[name]
+
+    def pixels(self, size):                                     # layout units -> render pixels
+        return round(size[0] * self.scale), round(size[1] * self.scale)
+
+    def scaled(self, name, size):                               # size in layout units
+        key = (name, self.pixels(size))
+        image = self.scaled_images.get(key)
+
+        if image is None:
+            image = pygame.transform.scale(self.images[name], key[1])
+            self.scaled_images[key] = image
+            self.scale_misses += 1
+
+        return image
@@ -0,0 +1,13 @@
+import time
+
+
+class StartupTimer:                                             # Time to First Frame / to the Main Screen
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks = list()                                     # (stage, ms since MuseRush started)
+
+    def mark(self, stage):
+        self.marks.append((stage, (time.perf_counter() - self.start) * 1000))
+
+    def report(self):
+        return "startup: " + ", ".join("%s %.0f ms" % mark for mark in self.marks)
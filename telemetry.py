@@ -0,0 +1,89 @@
+import json
+from array import array
+from settings import GOOD_WINDOW, MISS_WINDOW
+
+SPAWN = 0                                                       # event kinds
+PRESS = 1                                                       # key press (judged or not)
+HIT = 2                                                         # press judged perfect / good
+MISS_PRESS = 3                                                  # press judged miss
+EXPIRE = 4                                                      # note passed the good window without a press
+KINDS = ["spawn", "press", "hit", "miss", "expire"]
+HISTOGRAM_BIN = 10                                              # ms per offset histogram bin
+
+
+class Telemetry:                                                # Judgment Timing Trace (ring buffer)
+    def __init__(self, size=65536, song=""):
+        self.size = size
+        self.song = song
+        self.kinds = array('b', [0]) * size
+        self.times = array('i', [0]) * size                     # song time (ms)
+        self.lanes = array('b', [0]) * size                     # -1: no lane
+        self.notes = array('i', [0]) * size                     # chart note index (-1: no note)
+        self.offsets = array('f', [0]) * size                   # ms from the ideal time (negative: early)
+        self.count = 0                                          # events recorded (the ring keeps the last size)
+        self.histogram = array('i', [0]) * ((MISS_WINDOW + GOOD_WINDOW) // HISTOGRAM_BIN + 1)  # from -MISS_WINDOW
+        self.judged = [0, 0]                                    # per lane, every event (not only the ring)
+        self.missed = [0, 0]
+        self.hits = 0
+        self.offset_sum = 0.0                                   # hit offsets (mean / stddev)
+        self.offset_squares = 0.0
+
+    def record(self, kind, song_time, lane=-1, note_id=-1, offset=0.0):
+        index = self.count % self.size
+        self.kinds[index] = kind
+        self.times[index] = int(song_time)
+        self.lanes[index] = lane
+        self.notes[index] = note_id
+        self.offsets[index] = offset
+        self.count += 1
+
+        if kind < HIT:
+            return
+
+        self.judged[lane] += 1
+
+        if kind == HIT:
+            self.hits += 1
+            self.offset_sum += offset
+            self.offset_squares += offset * offset
+        else:
+            self.missed[lane] += 1
+
+        if kind != EXPIRE:                                      # pressed: offset histogram
+            slot = int((offset + MISS_WINDOW) // HISTOGRAM_BIN)
+            self.histogram[min(max(slot, 0), len(self.histogram) - 1)] += 1
+
+    def mean(self):                                             # ms, hits only (+: late, input lag)
+        return self.offset_sum / self.hits if self.hits else 0.0
+
+    def stddev(self):
+        if self.hits == 0:
+            return 0.0
+
+        return max(self.offset_squares / self.hits - self.mean() ** 2, 0.0) ** 0.5
+
+    def miss_rate(self, lane):
+        return self.missed[lane] / self.judged[lane] if self.judged[lane] else 0.0
+
+    def summary(self):
+        return {"song": self.song, "events": self.count, "hits": self.hits, "mean_ms": self.mean(),
+                "stddev_ms": self.stddev(), "miss_rate": [self.miss_rate(0), self.miss_rate(1)],
+                "histogram_start_ms": -MISS_WINDOW, "histogram_bin_ms": HISTOGRAM_BIN,
+                "histogram": list(self.histogram)}
+
+    def recorded(self):                                         # ring indexes in event order
+        if self.count <= self.size:
+            return range(self.count)
+
+        start = self.count % self.size
+        return [(start + i) % self.size for i in range(self.size)]
+
+    def rows(self):
+        for i in self.recorded():
+            yield {"kind": KINDS[self.kinds[i]], "time": self.times[i], "lane": self.lanes[i], "note": self.notes[i],
+                   "offset": round(self.offsets[i], 3)}
+
+    def dump(self, path):                                       # ndjson: one event per line
+        with open(path, 'w', encoding="UTF-8") as dump_file:
+            for row in self.rows():
+                dump_file.write(json.dumps(row) + '\n')
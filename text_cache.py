@@ -0,0 +1,91 @@
+import pygame
+from collections import OrderedDict
+from settings import ALPHA_MAX
+
+
+class TextCache:                                                # Font Pool + Rendered Text LRU
+    def __init__(self, fallback_font, max_entries=512, scale=1):
+        self.fallback_font = fallback_font                      # used when a language font can't be opened
+        self.max_entries = max_entries
+        self.scale = scale                                      # render scale (sizes come in render pixels)
+        self.fonts = dict()                                     # (font, size, bold, underline) -> Font
+        self.surfaces = OrderedDict()                           # render key -> Surface (LRU order)
+        self.hits = 0                                           # cache counters
+        self.misses = 0
+        self.font_loads = 0
+        self.frame_hits = 0                                     # per-frame counters (reset by new_frame)
+        self.frame_misses = 0
+
+    def new_frame(self):
+        self.frame_hits = 0
+        self.frame_misses = 0
+
+    def get_font(self, font_path, size, bold=False, underline=False):
+        key = (font_path, size, bold, underline)
+        font = self.fonts.get(key)
+
+        if font is None:
+            try:
+                font = pygame.font.Font(font_path, size)
+            except:
+                font = pygame.font.Font(self.fallback_font, size)
+
+            font.set_bold(bold)
+            font.set_underline(underline)
+            self.fonts[key] = font
+            self.font_loads += 1
+
+        return font
+
+    def render(self, text, size, color, font_path, bold=False, underline=False, antialias=True, rot=0,
+               alpha=ALPHA_MAX):
+        alpha = min(max(round(alpha), 0), ALPHA_MAX)
+        key = (text, size, tuple(color), bold, underline, font_path, antialias, rot, alpha)
+        surface = self.surfaces.get(key)
+
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            self.frame_hits += 1
+            return surface
+
+        self.misses += 1
+        self.frame_misses += 1
+
+        if alpha == ALPHA_MAX:
+            font = self.get_font(font_path, size, bold, underline)
+            surface = font.render(text, antialias, color)
+
+            if rot != 0:
+                surface = pygame.transform.rotate(surface, rot)
+        else:
+            base = self.render(text, size, color, font_path, bold, underline, antialias, rot)
+
+            if rot == 0:                                        # faded label on a black backing box
+                surface = pygame.Surface((len(text) * size, size + round(20 * self.scale)))
+                surface.fill((0, 0, 0))
+                surface.blit(base, (0, 0))
+            else:
+                surface = base.copy()
+
+            surface.set_alpha(alpha)
+
+        if pygame.display.get_surface() is not None:            # match the display pixel format once
+            surface = surface.convert_alpha() if surface.get_flags() & pygame.SRCALPHA else surface.convert()
+
+            if alpha != ALPHA_MAX:
+                surface.set_alpha(alpha)
+
+        self.surfaces[key] = surface
+
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "font_loads": self.font_loads,
+                "frame_hits": self.frame_hits, "frame_misses": self.frame_misses, "entries": len(self.surfaces)}
@@ -0,0 +1,59 @@
+import pygame
+
+
+class VoiceManager:                                             # Reserved Channels for Sound Effects
+    def __init__(self, voice_channels, buffer_size, latency=-1):
+        frequency = pygame.mixer.get_init()[0]
+        self.latency = latency if latency >= 0 else 2 * buffer_size * 1000 / frequency   # playing + queued buffer
+        self.sounds = dict()                                    # voice name -> Sound
+        self.channels = dict()                                  # voice name -> [Channel, ...] (the cap)
+        self.started = dict()                                   # voice name -> start tick per channel
+        self.triggered = set()                                  # voices played this frame
+        self.played = 0
+        self.deduped = 0                                        # same frame triggers dropped
+        self.stolen = 0                                         # busy channels restarted (cap reached)
+        reserved = sum(voice_channels.values())
+
+        if pygame.mixer.get_num_channels() < reserved + 4:     # keep unreserved channels for Sound.play
+            pygame.mixer.set_num_channels(reserved + 4)
+
+        pygame.mixer.set_reserved(reserved)
+        index = 0
+
+        for name, count in voice_channels.items():
+            self.channels[name] = [pygame.mixer.Channel(index + i) for i in range(count)]
+            self.started[name] = [0] * count
+            index += count
+
+    def add(self, name, sound):
+        self.sounds[name] = sound
+        return sound
+
+    def new_frame(self):
+        self.triggered.clear()
+
+    def play(self, name):
+        if name in self.triggered:
+            self.deduped += 1
+            return None
+
+        self.triggered.add(name)
+        channels = self.channels[name]
+        started = self.started[name]
+        index = next((i for i, channel in enumerate(channels) if not channel.get_busy()), -1)
+
+        if index < 0:                                           # every channel busy: restart the oldest
+            index = started.index(min(started))
+            self.stolen += 1
+
+        started[index] = pygame.time.get_ticks()
+        channels[index].play(self.sounds[name])
+        self.played += 1
+        return channels[index]
+
+    def busy(self):                                             # voices playing now
+        return sum(channel.get_busy() for channels in self.channels.values() for channel in channels)
+
+    def stats(self):
+        return {"latency_ms": self.latency, "played": self.played, "deduped": self.deduped, "stolen": self.stolen,
+                "busy": self.busy()}